@@ -1,13 +1,109 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
 from dateutil.relativedelta import relativedelta
 
+from cohort import BLEEDING_DRUGS
+from disease_groups import has_bled_groups
+
 
 def chads_vasc(patient, timestamp, max_value=2):
     return patient.calculate_chads_vasc(timestamp) >= max_value
 
 
 def future_stroke(patient, timestamp, months=12):
-    for s in patient.strokes:
-        # "timestamp < s" because "<=" would mean strokes are predicting itself
-        if timestamp < s <= timestamp + relativedelta(months=+months):
-            return True
-    return False
+    # The first stroke after timestamp, not on it, because that would mean strokes are predicting itself
+    s = patient.next_stroke(timestamp)
+    return s is not None and s <= timestamp + relativedelta(months=+months)
+
+
+def has_bled(patient, timestamp):
+    score = sum(points for group, points in has_bled_groups
+                if patient.has_disease_group(group, timestamp, chronic=True))
+    score += patient.calculate_age(timestamp) > 65
+    score += any(patient.has_medication_group(prefix, timestamp) for prefix in BLEEDING_DRUGS)
+    return score
+
+
+class DecisionRule(ABC):
+    """
+    Decides whether a patient should receive anticoagulants. decide() answers for a single patient on a single date,
+    decide_cohort() for a whole Cohort on one or more dates at once (see Cohort), both should give the same answers.
+    A rule can be used as the method of Patient.should_have_AC() as well.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, patient, timestamp):
+        return self.decide(patient, timestamp)
+
+    @abstractmethod
+    def decide(self, patient, timestamp):
+        pass
+
+    @abstractmethod
+    def decide_cohort(self, cohort, dates):
+        pass
+
+
+class ChadsVascThreshold(DecisionRule):
+    def __init__(self, threshold=2, name=None):
+        super(ChadsVascThreshold, self).__init__(name or "CHA2DS2-VASc >= {}".format(threshold))
+        self.threshold = threshold
+
+    def decide(self, patient, timestamp):
+        return patient.calculate_chads_vasc(timestamp) >= self.threshold
+
+    def decide_cohort(self, cohort, dates):
+        return cohort.chads_vasc(dates).score >= self.threshold
+
+
+class SexSpecificChadsVasc(DecisionRule):
+    """ Separate CHA2DS2-VASc thresholds for men and women, as women get a point for their sex """
+    def __init__(self, male=2, female=3, name=None):
+        super(SexSpecificChadsVasc, self).__init__(name or "CHA2DS2-VASc >= {} (m) / {} (f)".format(male, female))
+        self.male = male
+        self.female = female
+
+    def decide(self, patient, timestamp):
+        return patient.calculate_chads_vasc(timestamp) >= (self.female if patient.is_female() else self.male)
+
+    def decide_cohort(self, cohort, dates):
+        scores = cohort.chads_vasc(dates)
+        return scores.score >= np.where(scores.female, self.female, self.male)
+
+
+class HasBledRule(DecisionRule):
+    """ CHA2DS2-VASc threshold, unless the HAS-BLED bleeding risk reaches max_has_bled """
+    def __init__(self, threshold=2, max_has_bled=3, name=None):
+        super(HasBledRule, self).__init__(name or "CHA2DS2-VASc >= {}, HAS-BLED < {}".format(threshold, max_has_bled))
+        self.threshold = threshold
+        self.max_has_bled = max_has_bled
+
+    def decide(self, patient, timestamp):
+        return patient.calculate_chads_vasc(timestamp) >= self.threshold and \
+            has_bled(patient, timestamp) < self.max_has_bled
+
+    def decide_cohort(self, cohort, dates):
+        return (cohort.chads_vasc(dates).score >= self.threshold) & (cohort.has_bled(dates) < self.max_has_bled)
+
+
+decision_rules = {}
+
+
+def register_rule(rule):
+    if rule.name in decision_rules:
+        raise ValueError("A decision rule named {} is already registered".format(rule.name))
+    decision_rules[rule.name] = rule
+    return rule
+
+
+def evaluate_rules(cohort, dates, names=None):
+    """ Decisions of the registered rules (all of them if names is None) for the cohort on the dates """
+    names = decision_rules.keys() if names is None else names
+    return {name: decision_rules[name].decide_cohort(cohort, dates) for name in names}
+
+
+register_rule(ChadsVascThreshold(2))
+register_rule(SexSpecificChadsVasc(2, 3))
+register_rule(HasBledRule(2, 3))
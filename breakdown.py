@@ -7,6 +7,7 @@ from matplotlib import pyplot as plt
 from collections import Counter
 from dateutil.relativedelta import relativedelta
 
+from cohort import Cohort
 from disease_groups import atrial_fib
 from simulations.simulations import patient_month_generator
 
@@ -14,25 +15,21 @@ from simulations.simulations import patient_month_generator
 def breakdown(patients, timestamp):
     print("Score breakdown:")
 
-    patient_count = 0
-    female_count = 0
-    data = {i: BreakdownRow() for i in range(10)}
-    for patient in patients.values():
-        patient_count += 1
-        if patient.is_female():
-            female_count += 1
+    cohort = patients if isinstance(patients, Cohort) else Cohort(patients)
+    cohort_scores = cohort.chads_vasc(timestamp)
 
-        if not patient.is_alive(timestamp):
-            continue
+    patient_count = len(cohort)
+    female_count = int(cohort.female.sum())
 
-        score = patient.calculate_chads_vasc(timestamp)
-        data[score].update(patient.calculate_age(timestamp), patient.is_female())
+    alive = cohort_scores.alive
+    scores, ages, female = cohort_scores.score[alive], cohort_scores.age[alive], cohort_scores.female[alive]
+    rows = [scores == i for i in range(10)]
 
     d = dict()
-    d['# Patients'] = pd.Series([len(r.ages) for r in data.values()])
-    d['Mean Age'] = pd.Series([r.mean_std_age()[0] for r in data.values()])
-    d['Std Age'] = pd.Series([r.mean_std_age()[1] for r in data.values()])
-    d['% Female'] = pd.Series([r.percentage_female() for r in data.values()])
+    d['# Patients'] = pd.Series([r.sum() for r in rows])
+    d['Mean Age'] = pd.Series([ages[r].mean() if r.any() else np.nan for r in rows])
+    d['Std Age'] = pd.Series([ages[r].std() if r.any() else np.nan for r in rows])
+    d['% Female'] = pd.Series([100 * female[r].mean() if r.any() else np.nan for r in rows])
 
     print("Total number of patients: {}".format(patient_count))
     print("Number of female patients: {} ({}%)".format(female_count, female_count / patient_count * 100))
@@ -182,21 +179,3 @@ def plot_disease_frequency(diseases, diagnoses):
     # plt.yticks(x, labels)
     # plt.show()
     plt.savefig("output/breakdown/diagnosis_frequency", bbox_inches='tight')
-
-
-class BreakdownRow:
-    def __init__(self):
-        self.ages = []
-        self.female_count = 0
-
-    def update(self, age, is_female):
-        self.ages.append(age)
-        if is_female:
-            self.female_count += 1
-
-    def mean_std_age(self):
-        arr = np.array(self.ages)
-        return arr.mean(), arr.std()
-
-    def percentage_female(self):
-        return 100 * self.female_count / len(self.ages)
\ No newline at end of file
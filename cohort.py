@@ -0,0 +1,204 @@
+import datetime
+from collections import namedtuple
+
+import numpy as np
+
+from csv_reader.reader import date_array
+from disease_groups import atrial_fib, chads_vasc_groups, has_bled_groups
+
+NEVER = datetime.date(datetime.MAXYEAR, 12, 31)
+ANTITHROMBOTICS = "B01"
+BLEEDING_DRUGS = ("B01AC", "M01A")  # Platelet aggregation inhibitors and NSAIDs, the D of HAS-BLED
+STROKE_HORIZONS = (6, 12, 24)
+
+# Offset and factor to sort (row, date) pairs on a single int64 key
+_DAY_OFFSET = 1000000
+_ROW_FACTOR = 1 << 32
+
+CohortScores = namedtuple('CohortScores', ['score', 'age', 'alive', 'female'])
+
+
+def as_dates(dates):
+    """ A single date becomes a 0-d datetime64[D] array, anything else a 1-d array """
+    if isinstance(dates, datetime.date):
+        return np.array(dates, dtype='datetime64[D]')
+    if isinstance(dates, np.ndarray):
+        return dates.astype('datetime64[D]')
+    return date_array(dates)
+
+
+def date_parts(dates):
+    """ Year and month * 100 + day of a datetime64[D] array """
+    months = dates.astype('datetime64[M]')
+    years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    month_days = (months.astype(np.int64) % 12 + 1) * 100 + (dates - months).astype(np.int64) + 1
+    return years, month_days
+
+
+def add_months(dates, months):
+    """ dates + relativedelta(months=months) for a datetime64[D] array, the day is clipped to the end of the month """
+    first = dates.astype('datetime64[M]')
+    day = dates - first.astype('datetime64[D]')
+    month = first + np.timedelta64(months, 'M')
+    last_day = (month + np.timedelta64(1, 'M')).astype('datetime64[D]') - np.timedelta64(1, 'D')
+    return np.minimum(month.astype('datetime64[D]') + day, last_day)
+
+
+class Cohort:
+    """
+    Column wise copy of the patient data the CHA2DS2-VASc and HAS-BLED scores and the simulation eligibility need,
+    so a whole cohort is scored at once. Every method takes either a single date, which gives one value per patient,
+    or a sequence of dates, which gives a (patient x date) matrix. Rows are in the iteration order of the patients.
+    """
+    def __init__(self, patients, medication_groups=(ANTITHROMBOTICS,) + BLEEDING_DRUGS):
+        patient_list = list(patients.values())
+
+        self.numbers = np.array([p.number for p in patient_list])
+        self.birth_dates = date_array(p.birth_date for p in patient_list)
+        self.death_dates = date_array(p.death_date or NEVER for p in patient_list)
+        self.female = np.array([p.is_female() for p in patient_list], dtype=bool)
+
+        # Chronic onset of every CHA2DS2-VASc category, NEVER when it was not diagnosed
+        self.onsets = np.stack([date_array(p.onset(group) or NEVER for p in patient_list)
+                                for group, _ in chads_vasc_groups], axis=-1)
+        self.points = np.array([points for _, points in chads_vasc_groups])
+        self.bleeding_onsets = np.stack([date_array(p.onset(group) or NEVER for p in patient_list)
+                                         for group, _ in has_bled_groups], axis=-1)
+        self.bleeding_points = np.array([points for _, points in has_bled_groups])
+
+        self.af_onsets = date_array(p.onset(atrial_fib) or NEVER for p in patient_list)
+        self.last_diagnosis_starts = date_array(p.diagnoses.last_diagnosis.start_date
+                                                if p.diagnoses.last_diagnosis is not None else NEVER
+                                                for p in patient_list)
+
+        # Every stroke as (row, date), sorted on row and then on date
+        rows = [i for i, p in enumerate(patient_list) for _ in p.strokes]
+        self.stroke_rows = np.array(rows, dtype=np.int64)
+        self.stroke_dates = date_array(s for p in patient_list for s in p.strokes)
+        self._stroke_keys = self._row_date_keys(self.stroke_rows, self.stroke_dates)
+        order = np.argsort(self._stroke_keys, kind='stable')
+        self.stroke_rows, self.stroke_dates, self._stroke_keys = \
+            self.stroke_rows[order], self.stroke_dates[order], self._stroke_keys[order]
+
+        # Per ATC prefix every prescription of a matching code as (row, start date, end date) columns
+        self.medication_intervals = {prefix: self._medication_intervals(patient_list, prefix)
+                                     for prefix in medication_groups}
+
+        self._birth_years, self._birth_month_days = date_parts(self.birth_dates)
+
+    @staticmethod
+    def _medication_intervals(patient_list, prefix):
+        rows, starts, ends = [], [], []
+        for i, p in enumerate(patient_list):
+            for code in p.medications.codes_starting_with(prefix):
+                for m in p.medications[code]:
+                    rows.append(i)
+                    starts.append(m.start_date)
+                    ends.append(m.end_date)
+
+        return np.array(rows, dtype=np.int64), date_array(starts), date_array(ends)
+
+    @staticmethod
+    def _row_date_keys(rows, dates):
+        return rows * _ROW_FACTOR + (dates.astype(np.int64) + _DAY_OFFSET)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    @staticmethod
+    def _per_date(values, dates):
+        return values.reshape(values.shape + (1,) * dates.ndim)
+
+    def ages(self, dates):
+        dates = as_dates(dates)
+        years, month_days = date_parts(dates)
+        return years - self._per_date(self._birth_years, dates) - \
+            (month_days < self._per_date(self._birth_month_days, dates))
+
+    def alive(self, dates):
+        dates = as_dates(dates)
+        return (self._per_date(self.birth_dates, dates) <= dates) & (dates < self._per_date(self.death_dates, dates))
+
+    @staticmethod
+    def _diagnosed_points(onsets, points, dates):
+        onsets = onsets.reshape(onsets.shape + (1,) * dates.ndim)
+        points = points.reshape(points.shape + (1,) * dates.ndim)
+        return ((onsets <= dates) * points).sum(axis=1)
+
+    def chads_vasc(self, dates):
+        dates = as_dates(dates)
+
+        score = self._diagnosed_points(self.onsets, self.points, dates)
+
+        age = self.ages(dates)
+        score += (age >= 65).astype(int) + (age >= 75).astype(int)
+
+        female = np.broadcast_to(self._per_date(self.female, dates), score.shape)
+        score += female
+
+        return CohortScores(score, age, self.alive(dates), female)
+
+    def on_medication(self, prefix, dates):
+        """ Whether a medication of which the code starts with prefix is prescribed on the dates """
+        dates = as_dates(dates)
+        flat = dates.reshape(-1)
+        order = np.argsort(flat, kind='stable')
+        rows, starts, ends = self.medication_intervals[prefix]
+
+        # Every prescription covers a run of the sorted dates, mark where it starts and stops and sum along the dates
+        first = np.searchsorted(flat[order], starts, side='left')
+        stop = np.searchsorted(flat[order], ends, side='right')
+        covers = first < stop
+        counts = np.zeros((len(self), flat.size + 1), dtype=np.int64)
+        np.add.at(counts, (rows[covers], first[covers]), 1)
+        np.add.at(counts, (rows[covers], stop[covers]), -1)
+
+        active = np.empty((len(self), flat.size), dtype=bool)
+        active[:, order] = counts.cumsum(axis=1)[:, :-1] > 0
+        return active.reshape((len(self),) + dates.shape)
+
+    def eligible(self, dates, include_meds=False):
+        """
+        Patients that are part of the simulation on the dates, the ones that are alive, have atrial fibrillation,
+        were diagnosed with anything in the last year and don't receive antithrombotics (unless include_meds)
+        """
+        dates = as_dates(dates)
+        eligible = self.alive(dates)
+        eligible &= self._per_date(self.af_onsets, dates) <= dates
+        eligible &= dates - self._per_date(self.last_diagnosis_starts, dates) <= np.timedelta64(365, 'D')
+        if not include_meds:
+            eligible &= ~self.on_medication(ANTITHROMBOTICS, dates)
+
+        return eligible
+
+    def next_stroke(self, dates):
+        """ First stroke after the dates (not on them), NEVER if there is none """
+        dates = as_dates(dates)
+        rows = self._per_date(np.arange(len(self), dtype=np.int64), dates)
+        keys = self._row_date_keys(rows, np.broadcast_to(dates, rows.shape[:1] + dates.shape))
+
+        i = np.searchsorted(self._stroke_keys, keys, side='right')
+        found = i < len(self._stroke_keys)
+        found[found] = self.stroke_rows[i[found]] == np.broadcast_to(rows, keys.shape)[found]
+        next_stroke = np.full(keys.shape, np.datetime64(NEVER, 'D'))
+        next_stroke[found] = self.stroke_dates[i[found]]
+        return next_stroke
+
+    def future_stroke(self, dates, months=12):
+        """ Vectorized anticoagulant_decision.future_stroke(): a stroke after the dates, within months months """
+        return self.future_strokes(dates, horizons=(months,))[months]
+
+    def future_strokes(self, dates, horizons=STROKE_HORIZONS):
+        """ future_stroke() for every horizon (in months), next_stroke() is only searched once """
+        dates = as_dates(dates)
+        next_stroke = self.next_stroke(dates)
+        return {months: next_stroke <= add_months(dates, months) for months in horizons}
+
+    def has_bled(self, dates):
+        """ HAS-BLED score from the diagnosed groups, being older than 65 and the use of BLEEDING_DRUGS """
+        dates = as_dates(dates)
+
+        score = self._diagnosed_points(self.bleeding_onsets, self.bleeding_points, dates)
+        score += self.ages(dates) > 65
+        score += np.logical_or.reduce([self.on_medication(prefix, dates) for prefix in BLEEDING_DRUGS])
+        return score
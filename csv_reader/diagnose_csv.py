@@ -4,36 +4,59 @@ import pandas as pd
 import numpy as np
 
 from diagnosis import Diagnosis
-from disease import Disease
-from csv_reader.reader import convert_to_date
+from disease import disease_registry
+from csv_reader.reader import convert_column_to_date, to_dates, stream_records, collect_records, merge_records, \
+    MAX_DATE, CHUNK_SIZE
+
+DBC_REFORM_DATE = np.datetime64('2015-01-01')
 
 
 def dbc_end_date(x):
     return x + pd.Timedelta(days=120) if x >= pd.datetime(2015, 1, 1).date() else x + pd.Timedelta(days=365)
 
 
-def get_diagnoses(loc, sep, merge=True):
+def dbc_end_dates(start_dates):
+    """ Column wise version of dbc_end_date() on a datetime64[D] array """
+    durations = np.where(start_dates >= DBC_REFORM_DATE, 120, 365).astype('timedelta64[D]')
+    return np.minimum(start_dates + durations, MAX_DATE)
+
+
+def parse_diagnoses_dates(dataframe):
+    start_dates = convert_column_to_date(dataframe['BEGINDAT'])
+    end_dates = convert_column_to_date(dataframe['EINDDAT'])
+
+    # Before 2015 DBCs were allowed to be as long as one year, after that only 120 days
+    missing = dataframe['EINDDAT'].isnull().to_numpy()
+    end_dates[missing] = dbc_end_dates(start_dates[missing])
+
+    dataframe['BEGINDAT'] = to_dates(start_dates)
+    dataframe['EINDDAT'] = to_dates(end_dates)
+    return dataframe
+
+
+def read_diagnoses(loc, sep, chunksize=CHUNK_SIZE):
     converters = {'HOOFDDIAG': lambda x: str(x),
-                  'UITVOERDER': lambda x: str(x),
-                  'BEGINDAT': lambda x: convert_to_date(x)}
-    dataframe = pd.read_csv(loc, sep=sep, converters=converters)
+                  'UITVOERDER': lambda x: str(x)}
+    dtype = {'SPECIALISM': str, 'OMSCHRIJV': str, 'BEGINDAT': str, 'EINDDAT': str}
     # Fields: PATIENTNR	SPECIALISM	HOOFDDIAG	OMSCHRIJV	UITVOERDER	BEGINDAT	EINDDAT
+    for chunk in pd.read_csv(loc, sep=sep, converters=converters, dtype=dtype, chunksize=chunksize):
+        yield parse_diagnoses_dates(chunk)
 
-    # Before 2015 DBCs were allowed to be as long as one year, after that only 120 days
-    end_dates = dataframe['BEGINDAT'].apply(dbc_end_date)
-    dataframe['EINDDAT'] = dataframe['EINDDAT'].fillna(end_dates)
-    dataframe['EINDDAT'] = dataframe['EINDDAT'].apply(convert_to_date)
-
-    diagnoses = {}
-    for d in dataframe.itertuples():
-        if d.PATIENTNR not in diagnoses:
-            diagnoses[d.PATIENTNR] = []
-        diagnoses[d.PATIENTNR].append(Diagnosis(Disease(str(d.SPECIALISM),
-                                                        str(d.HOOFDDIAG),
-                                                        description=str(d.OMSCHRIJV)),
-                                                d.BEGINDAT,
-                                                d.EINDDAT,
-                                                practitioner=str(d.UITVOERDER)))
+
+def diagnosis_from_row(d):
+    return Diagnosis(disease_registry.get(str(d.SPECIALISM), str(d.HOOFDDIAG), description=str(d.OMSCHRIJV)),
+                     d.BEGINDAT,
+                     d.EINDDAT,
+                     practitioner=disease_registry.get_practitioner(str(d.UITVOERDER)))
+
+
+def iter_diagnoses(loc, sep, chunksize=CHUNK_SIZE):
+    """ Unmerged (patient_nr, [Diagnosis]) pairs, see stream_records() """
+    return stream_records(read_diagnoses(loc, sep, chunksize=chunksize), diagnosis_from_row)
+
+
+def get_diagnoses(loc, sep, merge=True, chunksize=CHUNK_SIZE):
+    diagnoses = collect_records(iter_diagnoses(loc, sep, chunksize=chunksize))
 
     if merge:
         merge_overlapping_diagnoses(diagnoses)
@@ -72,9 +95,7 @@ def remove_overlap(diagnosis_group):
 
 
 def merge_overlapping_diagnoses(diagnoses):
-    for patient_nr, patient_diagnoses in diagnoses.items():
-        continuous_diagnoses = []
-
-        for diagnosis_group in group_diagnoses(patient_diagnoses):
-            continuous_diagnoses += remove_overlap(diagnosis_group)
-        diagnoses[patient_nr] = continuous_diagnoses
+    merge_records(diagnoses, lambda d: d.disease,
+                  lambda first, last, end_date: Diagnosis(last.disease, first.start_date, end_date,
+                                                          practitioner=last.practitioner),
+                  practitioner=lambda d: d.practitioner)
@@ -1,21 +1,46 @@
 import pandas as pd
 
-from csv_reader.reader import convert_to_date
+from csv_reader.reader import convert_column_to_date, to_dates, stream_records, collect_records, merge_records, \
+    CHUNK_SIZE
 from medication import Medication
 
 
-def get_medications(loc, sep):
-    converters = {'VRSCHRDAT': lambda x: convert_to_date(x)}
-    dataframe = pd.read_csv(loc, sep=sep, converters=converters)
-    
-    dataframe['ACTSTOPDT'] = dataframe['ACTSTOPDT'].apply(convert_to_date)
-    dataframe['ATCCODE'] = dataframe['ATCCODE'].fillna('0000000')
+def parse_medications_dates(dataframe):
+    dataframe['VRSCHRDAT'] = to_dates(convert_column_to_date(dataframe['VRSCHRDAT']))
+    dataframe['ACTSTOPDT'] = to_dates(convert_column_to_date(dataframe['ACTSTOPDT']))
+    return dataframe
 
-    medications = {}
-    for m in dataframe.itertuples():
-        if m.PATIENTNR not in medications:
-            medications[m.PATIENTNR] = []
-        medications[m.PATIENTNR].append(Medication(m.ATCCODE, m.VRSCHRDAT, m.ACTSTOPDT))
 
+def read_medications(loc, sep, chunksize=CHUNK_SIZE):
+    dtype = {'ATCCODE': str, 'VRSCHRDAT': str, 'ACTSTOPDT': str}
+    for chunk in pd.read_csv(loc, sep=sep, dtype=dtype, chunksize=chunksize):
+        parse_medications_dates(chunk)
+        chunk['ATCCODE'] = chunk['ATCCODE'].fillna('0000000')
+        yield chunk
+
+
+def medication_from_row(m):
+    return Medication(m.ATCCODE, m.VRSCHRDAT, m.ACTSTOPDT)
+
+
+def iter_medications(loc, sep, chunksize=CHUNK_SIZE):
+    """ (patient_nr, [Medication]) pairs, see stream_records() """
+    return stream_records(read_medications(loc, sep, chunksize=chunksize), medication_from_row)
+
+
+def get_medications(loc, sep, chunksize=CHUNK_SIZE, coalesce=False):
+    medications = collect_records(iter_medications(loc, sep, chunksize=chunksize))
+
+    if coalesce:
+        removed = coalesce_medications(medications)
+        print("Coalesced medications, removed {} records".format(removed))
     return medications
-    # TODO: remove duplicates like diagnoses
+
+
+def coalesce_medications(medications):
+    """
+    Merge overlapping and adjacent prescriptions of the same ATC code per patient, returns the number removed.
+    A merged prescription starts at its first start, so has_medication_group(..., which=True) can change its answer.
+    """
+    return merge_records(medications, lambda m: m.code,
+                         lambda first, last, end_date: Medication(first.code, first.start_date, end_date))
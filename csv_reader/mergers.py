@@ -1,13 +1,35 @@
-import copy
+from collections.abc import Mapping
+from itertools import chain
 
 
-def merge_data(a, b):
-    merger = copy.deepcopy(a)
+class MergedData(Mapping):
+    """ Read only view of multiple datasets with distinct keys, the datasets themselves are not copied """
+    def __init__(self, *maps):
+        self.maps = maps
 
-    for key, value in b.items():
-        if key in merger:
-            raise NotImplementedError
+    def __getitem__(self, key):
+        for m in self.maps:
+            if key in m:
+                return m[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return chain.from_iterable(self.maps)
+
+    def __len__(self):
+        return sum(len(m) for m in self.maps)
+
+    def __contains__(self, key):
+        return any(key in m for m in self.maps)
 
-        merger[key] = value
+    def __repr__(self):
+        return "MergedData({})".format(", ".join(map(repr, self.maps)))
+
+
+def merge_data(a, b):
+    for key in b.keys():
+        if key in a:
+            raise NotImplementedError
 
-    return merger
+    maps = a.maps if isinstance(a, MergedData) else (a,)
+    return MergedData(*maps, b)
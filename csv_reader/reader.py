@@ -1,5 +1,15 @@
 import datetime
 
+import numpy as np
+import pandas as pd
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+MAX_DATE = np.datetime64(datetime.date(datetime.MAXYEAR, 12, 31), 'D')
+CHUNK_SIZE = 500000
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+NAT_DAYS = np.iinfo(np.int64).min
+
 
 def convert_to_date(datetime_string):
     if isinstance(datetime_string, datetime.date):
@@ -8,4 +18,134 @@ def convert_to_date(datetime_string):
     if datetime_string != datetime_string or datetime_string == 'NULL':
         return datetime.date(datetime.MAXYEAR, 12, 31)
 
-    return datetime.datetime.strptime(datetime_string, '%Y-%m-%d %H:%M:%S.%f').date()
+    return datetime.datetime.strptime(datetime_string, DATE_FORMAT).date()
+
+
+def convert_column_to_date(column):
+    """ Column wise version of convert_to_date(), returns a datetime64[D] array """
+    column = pd.Series(column, copy=False)
+    missing = column.isnull().to_numpy() | (column == 'NULL').to_numpy()
+
+    # Only the date part of the timestamp is used, numpy parses 'YYYY-MM-DD' strings by itself
+    days = column.astype(str).str.slice(0, 10).to_numpy(dtype=object)
+    days[missing] = str(MAX_DATE)
+
+    return days.astype('datetime64[D]')
+
+
+def date_array(dates):
+    """ datetime64[D] array from datetime.date objects (None becomes NaT), faster than np.array(dates, dtype=...) """
+    return np.fromiter((d.toordinal() - EPOCH_ORDINAL if d is not None else NAT_DAYS for d in dates),
+                       dtype=np.int64).astype('datetime64[D]')
+
+
+def to_dates(column):
+    """ Convert a datetime64[D] array back to datetime.date objects """
+    return np.asarray(column, dtype='datetime64[D]').astype(object)
+
+
+def stream_records(chunks, build):
+    """
+    Yield (patient_nr, [records]) for every run of consecutive rows of the same patient.
+    A run continues over chunk boundaries, so only one chunk and one patient are held at a time.
+    When the rows of a patient are not grouped in the extract the patient is yielded once per run.
+    """
+    patient_nr, records = None, []
+    for chunk in chunks:
+        for row in chunk.itertuples():
+            if row.PATIENTNR != patient_nr:
+                if records:
+                    yield patient_nr, records
+                patient_nr, records = row.PATIENTNR, []
+            records.append(build(row))
+
+    if records:
+        yield patient_nr, records
+
+
+def collect_records(stream):
+    records = {}
+    for patient_nr, patient_records in stream:
+        if patient_nr not in records:
+            records[patient_nr] = []
+        records[patient_nr] += patient_records
+
+    return records
+
+
+def index_values(values):
+    table = {}
+    return np.array([table.setdefault(v, len(table)) for v in values], dtype=np.int64), len(table)
+
+
+def merge_spells(groups, practitioners, start_days, end_days):
+    """
+    Sort-and-scan version of remove_overlap() over a whole table of diagnoses or medications.
+    Rows are sorted on (group, start date), a new spell starts at a new group, a change of practitioner or a gap
+    of more than one day after the spell so far. Dates are given in days, groups and practitioners as integers.
+    Returns the sort order, the position of the first row of every spell in that order and the spell end dates.
+    """
+    n = len(groups)
+    order = np.lexsort((np.arange(n), start_days, groups))
+    groups, practitioners = groups[order], practitioners[order]
+    start_days, end_days = start_days[order], end_days[order]
+
+    breaks = np.ones(n, dtype=bool)
+    breaks[1:] = (groups[1:] != groups[:-1]) | (practitioners[1:] != practitioners[:-1])
+
+    # The end of a spell is the running maximum of the end dates since its first row. Each round the running
+    # maximum is taken per segment between the known breaks, gaps found this way are always real breaks. Only
+    # spells containing an end date before its start date need more than one extra round.
+    offset = end_days.min(initial=0)
+    scale = end_days.max(initial=0) - offset + 1
+    while True:
+        segments = np.cumsum(breaks) * scale
+        running_end = np.maximum.accumulate(end_days - offset + segments) - segments + offset
+
+        new_breaks = breaks.copy()
+        new_breaks[1:] |= start_days[1:] - 1 > running_end[:-1]
+        if np.array_equal(new_breaks, breaks):
+            break
+        breaks = new_breaks
+
+    spell_starts = np.flatnonzero(breaks)
+    spell_ends = np.maximum.reduceat(end_days, spell_starts) if n else end_days
+
+    return order, spell_starts, spell_ends
+
+
+def merge_records(records, key, build, practitioner=None):
+    """
+    Merge the spells (see merge_spells()) of every patient's records with the same key(record), in place.
+    A spell of one record keeps it, longer spells become build(first record, last record, end date). Without a
+    practitioner function a change of practitioner never starts a new spell. Returns the number of records removed.
+    """
+    flat = [r for patient_records in records.values() for r in patient_records]
+    if not flat:
+        return 0
+
+    patient_indexes = np.repeat(np.arange(len(records)), [len(v) for v in records.values()])
+    key_indexes, n_keys = index_values(key(r) for r in flat)
+    if practitioner is None:
+        practitioner_indexes = np.zeros(len(flat), dtype=np.int64)
+    else:
+        practitioner_indexes, _ = index_values(practitioner(r) for r in flat)
+    start_days = date_array(r.start_date for r in flat).astype(np.int64)
+    end_days = date_array(r.end_date for r in flat).astype(np.int64)
+
+    # Groups are ordered by their first row, which keeps the patients and their keys in the original order
+    _, first_rows, inverse = np.unique(patient_indexes * n_keys + key_indexes, return_index=True, return_inverse=True)
+    order, spell_starts, spell_ends = merge_spells(first_rows[inverse], practitioner_indexes, start_days, end_days)
+
+    first_records = order[spell_starts].tolist()
+    last_records = order[np.append(spell_starts[1:], len(order)) - 1].tolist()
+    end_dates = to_dates(spell_ends.astype('datetime64[D]'))
+
+    patient_nrs = list(records.keys())
+    merged = {patient_nr: [] for patient_nr in patient_nrs}
+    for first, last, end_date in zip(first_records, last_records, end_dates):
+        record = flat[first] if first == last else build(flat[first], flat[last], end_date)
+        merged[patient_nrs[patient_indexes[first]]].append(record)
+
+    records.update(merged)
+    return len(flat) - len(spell_starts)
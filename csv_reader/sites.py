@@ -0,0 +1,66 @@
+from multiprocessing import Pool
+
+from csv_reader.diagnose_csv import get_diagnoses
+from csv_reader.medication_csv import get_medications
+from csv_reader.mergers import merge_data
+from csv_reader.patients_csv import get_patients
+from csv_reader.store import store_arrays, PatientStore
+
+
+def add_diseases(patients, diagnoses_dict):
+    for patient_nr, diagnoses in diagnoses_dict.items():
+        for diagnosis in diagnoses:
+            patients[patient_nr].add_diagnosis(diagnosis)
+
+
+def add_medications(patients, medications_dict):
+    for patient_nr, medications in medications_dict.items():
+        for medication in medications:
+            try:
+                patients[patient_nr].add_medication(medication)
+            except KeyError:
+                print("Missing data, patient {}".format(patient_nr))
+                continue
+
+
+def prepare_site_data(patients_file, diagnoses_file, medications_file, sep='\t', coalesce=False):
+    """ Coalescing medications moves the start of renewed prescriptions back, see coalesce_medications() """
+    print("Reading CSV files...")
+    patients = get_patients(patients_file, sep)
+    diagnoses = get_diagnoses(diagnoses_file, sep, merge=False)
+    medications = get_medications(medications_file, sep, coalesce=coalesce)
+
+    print("Linking data...")
+    add_diseases(patients, diagnoses)
+    add_medications(patients, medications)
+
+    print("Finding events...")
+    for p in patients.values():
+        p.set_care_range(extra_months=12)
+        p.find_strokes()
+        p.find_chads_vasc_changes()
+
+    return patients, diagnoses, medications
+
+
+def prepare_site(patients_file, diagnoses_file, medications_file, sep='\t', coalesce=False):
+    # Only the columns are send back to the parent process, not the linked objects
+    return store_arrays(*prepare_site_data(patients_file, diagnoses_file, medications_file, sep=sep, coalesce=coalesce))
+
+
+def prepare_sites(sites, sep='\t', coalesce=False, processes=None):
+    """ Reads every site, a (patients file, diagnoses file, medications file) tuple, in its own process """
+    with Pool(processes=processes) as pool:
+        site_arrays = pool.starmap(prepare_site, [tuple(files) + (sep, coalesce) for files in sites])
+
+    return [PatientStore(arrays) for arrays in site_arrays]
+
+
+def combine_sites(sites):
+    patients, diagnoses, medications = sites[0], sites[0].diagnoses, sites[0].medications
+    for site in sites[1:]:
+        patients = merge_data(patients, site)
+        diagnoses = merge_data(diagnoses, site.diagnoses)
+        medications = merge_data(medications, site.medications)
+
+    return patients, diagnoses, medications
@@ -0,0 +1,192 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+from csv_reader.reader import date_array, to_dates
+from diagnosis import Diagnosis
+from disease import disease_registry
+from medication import Medication
+from patient import Patient
+
+STORE_VERSION = 1
+
+
+def _index_table(values):
+    """ Map every value to an index in a table of unique values, None gets index -1 """
+    table = {}
+    indexes = np.empty(len(values), dtype=np.int32)
+    for i, v in enumerate(values):
+        if v is None:
+            indexes[i] = -1
+            continue
+        if v not in table:
+            table[v] = len(table)
+        indexes[i] = table[v]
+
+    return indexes, list(table.keys())
+
+
+def _string_array(strings):
+    return np.array(strings, dtype=str) if strings else np.array([], dtype='U1')
+
+
+def _flatten(records):
+    keys, counts, flat = [], [], []
+    for key, values in records.items():
+        keys.append(key)
+        counts.append(len(values))
+        flat += values
+
+    return keys, np.array(counts, dtype=np.int64), flat
+
+
+def store_arrays(patients, diagnoses, medications):
+    arrays = {'version': np.array(STORE_VERSION)}
+
+    patient_list = list(patients.values())
+    arrays['patient_number'] = np.array([p.number for p in patient_list])
+    arrays['patient_sex'] = _string_array([p.sex for p in patient_list])
+    arrays['patient_birth'] = date_array([p.birth_date for p in patient_list])
+    arrays['patient_death'] = date_array([p.death_date for p in patient_list])
+    arrays['patient_care_start'] = date_array([p.care_range[0] for p in patient_list])
+    arrays['patient_care_end'] = date_array([p.care_range[1] for p in patient_list])
+
+    keys, counts, flat = _flatten(diagnoses)
+    disease_indexes, disease_table = _index_table([d.disease for d in flat])
+    practitioner_indexes, practitioner_table = _index_table([d.practitioner for d in flat])
+    arrays['diagnosis_keys'] = np.array(keys)
+    arrays['diagnosis_counts'] = counts
+    arrays['diagnosis_disease'] = disease_indexes
+    arrays['diagnosis_start'] = date_array([d.start_date for d in flat])
+    arrays['diagnosis_end'] = date_array([d.end_date for d in flat])
+    arrays['diagnosis_practitioner'] = practitioner_indexes
+    arrays['practitioners'] = _string_array(practitioner_table)
+
+    # Diseases compare on (spec, diag) only, the description of the first occurrence is kept
+    arrays['disease_spec'] = _string_array([d.spec for d in disease_table])
+    arrays['disease_diag'] = _string_array([d.diag for d in disease_table])
+    arrays['disease_description'] = _string_array([d.description or "" for d in disease_table])
+    arrays['disease_has_description'] = np.array([d.description is not None for d in disease_table], dtype=bool)
+
+    keys, counts, flat = _flatten(medications)
+    code_indexes, code_table = _index_table([m.code for m in flat])
+    arrays['medication_keys'] = np.array(keys)
+    arrays['medication_counts'] = counts
+    arrays['medication_code'] = code_indexes
+    arrays['medication_start'] = date_array([m.start_date for m in flat])
+    arrays['medication_end'] = date_array([m.end_date for m in flat])
+    arrays['medication_codes'] = _string_array(code_table)
+
+    return arrays
+
+
+def write_store(fname, arrays):
+    with open(fname, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def save_store(fname, patients, diagnoses, medications):
+    write_store(fname, store_arrays(patients, diagnoses, medications))
+
+
+def load_store(fname):
+    with np.load(fname, allow_pickle=False) as data:
+        arrays = {k: data[k] for k in data.files}
+
+    return PatientStore(arrays)
+
+
+class RecordView(Mapping):
+    """ Read only patient_nr -> [records] mapping which builds the record lists on first access """
+    def __init__(self, keys, counts, build):
+        self._keys = keys.tolist()
+        self._build = build
+        offsets = np.concatenate(([0], np.cumsum(counts))).tolist()
+        self._ranges = {k: (offsets[i], offsets[i + 1]) for i, k in enumerate(self._keys)}
+        self._cache = {}
+
+    def __getitem__(self, key):
+        if key not in self._cache:
+            start, stop = self._ranges[key]
+            self._cache[key] = self._build(start, stop)
+        return self._cache[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._ranges
+
+
+class PatientStore(Mapping):
+    """ Read only patient_nr -> Patient mapping backed by the columns of a store file """
+    def __init__(self, arrays):
+        version = int(arrays['version'])
+        if version != STORE_VERSION:
+            raise ValueError("Store version {} is not supported, expected {}".format(version, STORE_VERSION))
+
+        self.arrays = arrays
+
+        self.diseases = [disease_registry.get(spec, diag, description=description if has_description else None)
+                         for spec, diag, description, has_description in zip(arrays['disease_spec'].tolist(),
+                                                                               arrays['disease_diag'].tolist(),
+                                                                               arrays['disease_description'].tolist(),
+                                                                               arrays['disease_has_description'])]
+        self.practitioners = [disease_registry.get_practitioner(p) for p in arrays['practitioners'].tolist()]
+        self.codes = arrays['medication_codes'].tolist()
+
+        self.diagnoses = RecordView(arrays['diagnosis_keys'], arrays['diagnosis_counts'], self._build_diagnoses)
+        self.medications = RecordView(arrays['medication_keys'], arrays['medication_counts'], self._build_medications)
+
+        self._numbers = arrays['patient_number'].tolist()
+        self._rows = {n: i for i, n in enumerate(self._numbers)}
+        self._cache = {}
+
+    def _build_diagnoses(self, start, stop):
+        a = self.arrays
+        return [Diagnosis(self.diseases[disease], start_date, end_date,
+                          practitioner=self.practitioners[practitioner] if practitioner >= 0 else None)
+                for disease, start_date, end_date, practitioner in zip(a['diagnosis_disease'][start:stop].tolist(),
+                                                                       to_dates(a['diagnosis_start'][start:stop]),
+                                                                       to_dates(a['diagnosis_end'][start:stop]),
+                                                                       a['diagnosis_practitioner'][start:stop].tolist())]
+
+    def _build_medications(self, start, stop):
+        a = self.arrays
+        return [Medication(self.codes[code], start_date, end_date)
+                for code, start_date, end_date in zip(a['medication_code'][start:stop].tolist(),
+                                                      to_dates(a['medication_start'][start:stop]),
+                                                      to_dates(a['medication_end'][start:stop]))]
+
+    def _build_patient(self, i):
+        a = self.arrays
+        number = self._numbers[i]
+        patient = Patient(number, str(a['patient_sex'][i]),
+                          a['patient_birth'][i].item(), a['patient_death'][i].item())
+
+        for diagnosis in self.diagnoses.get(number, []):
+            patient.add_diagnosis(diagnosis)
+        for medication in self.medications.get(number, []):
+            patient.add_medication(medication)
+
+        patient.care_range = (a['patient_care_start'][i].item(), a['patient_care_end'][i].item())
+        patient.find_strokes()
+
+        return patient
+
+    def __getitem__(self, number):
+        if number not in self._cache:
+            self._cache[number] = self._build_patient(self._rows[number])
+        return self._cache[number]
+
+    def __iter__(self):
+        return iter(self._numbers)
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def __contains__(self, number):
+        return number in self._rows
@@ -1,4 +1,6 @@
 class Diagnosis:
+    __slots__ = ('disease', 'start_date', 'end_date', 'practitioner')
+
     def __init__(self, disease, start_date, end_date, practitioner=None):
         self.disease = disease
         self.start_date = start_date
@@ -14,7 +16,8 @@ class Diagnosis:
         return self.start_date < other.start_date
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return (self.disease == other.disease and self.start_date == other.start_date and
+                self.end_date == other.end_date and self.practitioner == other.practitioner)
 
     def dump(self):
         print(self.disease.spec)
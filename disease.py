@@ -1,8 +1,11 @@
 class Disease:
+    __slots__ = ('spec', 'diag', 'description', '_hash')
+
     def __init__(self, spec, diag, description=None):
         self.spec = spec
         self.diag = diag
         self.description = description
+        self._hash = hash((spec, diag))
 
     def __repr__(self):
         if self.description:
@@ -13,7 +16,49 @@ class Disease:
         return self.spec == other.spec and self.diag == other.diag
 
     def __hash__(self):
-        return hash((self.spec, self.diag))
+        return self._hash
+
+    def __reduce__(self):
+        # The cached hash of the strings differs between interpreters, so it is recomputed on unpickling
+        return Disease, (self.spec, self.diag, self.description)
 
     def dump(self):
         print(self.spec, self.diag, self.description)
+
+
+class DiseaseRegistry:
+    """
+    Hands out one shared Disease instance per (spec, diag) and one shared string per practitioner,
+    both with a compact integer id. The description of the first registered instance is kept.
+    """
+    def __init__(self):
+        self.diseases = []
+        self.practitioners = []
+        self._disease_ids = {}
+        self._practitioner_ids = {}
+
+    def get(self, spec, diag, description=None):
+        i = self._disease_ids.get((spec, diag))
+        if i is None:
+            i = self._disease_ids[(spec, diag)] = len(self.diseases)
+            self.diseases.append(Disease(spec, diag, description=description))
+        return self.diseases[i]
+
+    def get_id(self, disease):
+        return self._disease_ids[(disease.spec, disease.diag)]
+
+    def get_practitioner(self, practitioner):
+        i = self._practitioner_ids.get(practitioner)
+        if i is None:
+            i = self._practitioner_ids[practitioner] = len(self.practitioners)
+            self.practitioners.append(practitioner)
+        return self.practitioners[i]
+
+    def get_practitioner_id(self, practitioner):
+        return self._practitioner_ids[practitioner]
+
+    def __len__(self):
+        return len(self.diseases)
+
+
+disease_registry = DiseaseRegistry()
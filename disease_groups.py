@@ -121,9 +121,16 @@ chads_vasc_v = [
     Disease("REV", "F24", description="Hart/bloedvaten 4"),
 ]
 
+# Points every category adds to the CHA2DS2-VASc score once it has been diagnosed
+chads_vasc_groups = [(chads_vasc_c, 1), (chads_vasc_h, 1), (chads_vasc_d, 1), (chads_vasc_s, 2), (chads_vasc_v, 1)]
+
 # Currently a copy of chads_vasc_s but might differ in the future
 stroke_diseases = chads_vasc_s
 
+# Points every category adds to the HAS-BLED bleeding risk score once it has been diagnosed. There are no groups yet
+# for abnormal renal/liver function, bleeding and labile INR, so those categories never score
+has_bled_groups = [(chads_vasc_h, 1), (stroke_diseases, 1)]
+
 atrial_fib = [Disease("CAR", "401"), Disease("INT", "106")]
 
 
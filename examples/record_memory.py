@@ -0,0 +1,62 @@
+"""
+Measures the memory used per Diagnosis, Medication and Disease instance, compared to the same classes
+without __slots__ (as they were before). Field values are shared between the records so only the
+records themselves are counted, the 8 bytes per record of the list holding them included.
+Run from the repository root: python -m examples.record_memory
+"""
+import datetime
+import tracemalloc
+
+from diagnosis import Diagnosis
+from disease import Disease
+from medication import Medication
+
+
+class DictDiagnosis:
+    def __init__(self, disease, start_date, end_date, practitioner=None):
+        self.disease = disease
+        self.start_date = start_date
+        self.end_date = end_date
+        self.practitioner = practitioner
+
+
+class DictMedication:
+    def __init__(self, code, start_date, end_date):
+        self.code = code
+        self.start_date = start_date
+        self.end_date = end_date
+
+
+class DictDisease:
+    def __init__(self, spec, diag, description=None):
+        self.spec = spec
+        self.diag = diag
+        self.description = description
+
+
+def bytes_per_record(factory, n=100000):
+    tracemalloc.start()
+    records = [factory() for _ in range(n)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del records
+    return size / n
+
+
+if __name__ == "__main__":
+    disease = Disease("CAR", "401", description="Atriumfibrilleren")
+    start, end = datetime.date(2015, 1, 1), datetime.date(2015, 5, 1)
+
+    benchmarks = [
+        ("Diagnosis", lambda: DictDiagnosis(disease, start, end, "John Deer"),
+                      lambda: Diagnosis(disease, start, end, "John Deer")),
+        ("Medication", lambda: DictMedication("B01AA07", start, end),
+                       lambda: Medication("B01AA07", start, end)),
+        ("Disease", lambda: DictDisease("CAR", "401", "Atriumfibrilleren"),
+                    lambda: Disease("CAR", "401", "Atriumfibrilleren")),
+    ]
+
+    print("{:<12}{:>10}{:>10}".format("Record", "Before", "After"))
+    for name, before, after in benchmarks:
+        print("{:<12}{:>10.1f}{:>10.1f}".format(name, bytes_per_record(before), bytes_per_record(after)))
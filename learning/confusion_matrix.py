@@ -1,6 +1,29 @@
 import numpy as np
 
 
+def sweep_counts(true, scores, thresholds):
+    """
+    (t_p, f_n, f_p, t_n) arrays with the counts of predicting positive when score > threshold, for every threshold.
+    The scores are sorted once, after that every threshold is a binary search in the cumulative sum of the positives.
+    """
+    true = np.asarray(true) == 1
+    scores = np.asarray(scores)
+    thresholds = np.asarray(thresholds)
+
+    order = np.argsort(scores, kind='stable')
+    sorted_scores = scores[order]
+    positives_below = np.concatenate(([0], np.cumsum(true[order])))
+
+    # Rows with a score <= threshold are predicted negative
+    predicted_negative = np.searchsorted(sorted_scores, thresholds, side='right')
+    f_n = positives_below[predicted_negative]
+    t_p = positives_below[-1] - f_n
+    f_p = (len(scores) - predicted_negative) - t_p
+    t_n = predicted_negative - f_n
+
+    return t_p, f_n, f_p, t_n
+
+
 class ConfusionMatrix:
     def __init__(self, true, predict, name=None):
         if len(true) != len(predict):
@@ -10,12 +33,30 @@ class ConfusionMatrix:
         self.predict = predict
         self.name = name
 
-        self.c_p = sum(true)
-        self.c_n = len(true) - self.c_p
-        self.p_p = sum(predict)
-        self.p_n = len(predict) - self.p_p
-
-        self.t_p, self.f_n, self.f_p, self.t_n = self.calculate_matrix()
+        self._set_matrix(*self.calculate_matrix())
+
+    @classmethod
+    def from_counts(cls, t_p, f_n, f_p, t_n, name=None):
+        """ Confusion matrix of which only the counts are known, true and predict are None """
+        cm = cls.__new__(cls)
+        cm.true = cm.predict = None
+        cm.name = name
+        cm._set_matrix(t_p, f_n, f_p, t_n)
+        return cm
+
+    @classmethod
+    def sweep(cls, true, scores, thresholds, name=None):
+        """ One confusion matrix per threshold, predicting positive when score > threshold, see sweep_counts() """
+        counts = zip(*(c.tolist() for c in sweep_counts(true, scores, thresholds)))
+        return [cls.from_counts(t_p, f_n, f_p, t_n, name=name) for t_p, f_n, f_p, t_n in counts]
+
+    def _set_matrix(self, t_p, f_n, f_p, t_n):
+        self.c_p = t_p + f_n
+        self.c_n = f_p + t_n
+        self.p_p = t_p + f_p
+        self.p_n = f_n + t_n
+
+        self.t_p, self.f_n, self.f_p, self.t_n = t_p, f_n, f_p, t_n
         self.matrix = (self.t_p, self.f_n, self.f_p, self.t_n)
 
         # Division by zero now returns inf
@@ -61,18 +102,13 @@ class ConfusionMatrix:
             return (n**2 + 1) * np.divide((self.tnr * self.tpr), (n**2 * self.tnr + self.tpr))
 
     def calculate_matrix(self):
-        t_p = f_n = f_p = t_n = 0
-        for i in range(len(self.true)):
-            t = self.true[i]
-            p = self.predict[i]
-            if t == p == 1:
-                t_p += 1
-            elif t == p == 0:
-                t_n += 1
-            elif t == 1 and p == 0:
-                f_n += 1
-            else:
-                f_p += 1
+        true = np.asarray(self.true)
+        predict = np.asarray(self.predict)
+
+        t_p = int(np.count_nonzero((true == 1) & (predict == 1)))
+        t_n = int(np.count_nonzero((true == 0) & (predict == 0)))
+        f_n = int(np.count_nonzero((true == 1) & (predict == 0)))
+        f_p = len(true) - t_p - t_n - f_n
 
         return t_p, f_n, f_p, t_n
 
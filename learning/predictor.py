@@ -1,9 +1,10 @@
 import numpy as np
 from sklearn import ensemble
-from sklearn.model_selection import cross_val_score, GroupKFold
+from sklearn.base import clone
+from sklearn.model_selection import GroupKFold
 from sklearn import metrics
 
-from learning.confusion_matrix import ConfusionMatrix
+from learning.confusion_matrix import ConfusionMatrix, sweep_counts
 from learning.plot import *
 
 
@@ -18,13 +19,50 @@ def custom_score(cutoff, beta):
     return score_cutoff
 
 
-def predict(x_learn, y_learn, groups, x_test, y_test, labels, n_features=.33, cutoff=None, s_beta=2, plot=False):
+def out_of_fold_probabilities(clf, x, y, groups, cv):
+    """
+    Positive class probability of every row, predicted by a copy of clf fitted on the other folds. One fit per fold,
+    the returned folds are the row indexes of every validation fold.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    probabilities = np.empty(len(y))
+    folds = []
+    for learn, validate in cv.split(x, y, groups):
+        fold_clf = clone(clf).fit(x[learn], y[learn])
+        probabilities[validate] = fold_clf.predict_proba(x[validate])[:, 1]
+        folds.append(validate)
+
+    return probabilities, folds
+
+
+def cutoff_rates(y, probabilities, folds, cutoffs):
+    """ True positive and true negative rate of every (cutoff, fold) pair """
+    tpr = np.empty((len(cutoffs), len(folds)))
+    tnr = np.empty((len(cutoffs), len(folds)))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for j, fold in enumerate(folds):
+            t_p, f_n, f_p, t_n = sweep_counts(np.asarray(y)[fold], probabilities[fold], cutoffs)
+            tpr[:, j] = np.divide(t_p, t_p + f_n)
+            tnr[:, j] = np.divide(t_n, f_p + t_n)
+
+    return tpr, tnr
+
+
+def s_beta_scores(tpr, tnr, beta):
+    """ The score custom_score() gives, from the rates of cutoff_rates() """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (beta ** 2 + 1) * (tnr * tpr) / (beta ** 2 * tnr + tpr)
+
+
+def predict(x_learn, y_learn, groups, x_test, y_test, labels, n_features=.33, cutoff=None, s_beta=2, plot=False,
+            cutoffs=None):
     clf = ensemble.RandomForestClassifier(n_estimators=100, n_jobs=-1, class_weight='balanced')
 
     print("# Learn Data Size:  {}".format(len(x_learn)))
-    print("# Positive Target:  {}".format(sum(y_learn)))
+    print("# Positive Target:  {}".format(np.count_nonzero(y_learn)))
     print("# Test Data Size:   {}".format(len(x_test)))
-    print("# Positive Target:  {}".format(sum(y_test)))
+    print("# Positive Target:  {}".format(np.count_nonzero(y_test)))
     print("# Features:         {}".format(len(labels)))
 
     print("Fitting Whole Dataset... ")
@@ -51,14 +89,16 @@ def predict(x_learn, y_learn, groups, x_test, y_test, labels, n_features=.33, cu
 
         gkf = GroupKFold(n_splits=10)
 
-        cutoffs = np.arange(0.025, 0.275, 0.025)
-        cutoff_scores = []
+        # The cutoff only thresholds the probabilities, so every fold is fitted once and all cutoffs are scored on
+        # the same out of fold probabilities
+        if cutoffs is None:
+            cutoffs = np.arange(0.025, 0.275, 0.025)
+        tmp_clf = ensemble.RandomForestClassifier(n_estimators=100, n_jobs=-1, class_weight='balanced')
+        probabilities, folds = out_of_fold_probabilities(tmp_clf, x_learn, y_learn, groups, gkf)
+        cutoff_scores = s_beta_scores(*cutoff_rates(y_learn, probabilities, folds, cutoffs), s_beta)
+
         highest_mean, highest_cutoff = 0, 0
-        for c in cutoffs:
-            tmp_clf = ensemble.RandomForestClassifier(n_estimators=100, n_jobs=-1, class_weight='balanced')
-            validated = cross_val_score(tmp_clf, x_learn, y_learn, cv=gkf.split(x_learn, y_learn, groups),
-                                        scoring=custom_score(c, s_beta))
-            cutoff_scores.append(validated)
+        for c, validated in zip(cutoffs, cutoff_scores):
             mean = np.mean(validated)
 
             print("Cutoff: {} with mean: {} | {}".format(c, mean, validated))
@@ -73,13 +113,13 @@ def predict(x_learn, y_learn, groups, x_test, y_test, labels, n_features=.33, cu
         cutoff = highest_cutoff
 
         if plot:
-            plot_cutoffs(cutoffs, cutoff_scores, ylabel="$S_{%s}$ Score" % s_beta)
+            plot_cutoffs(cutoffs, list(cutoff_scores), ylabel="$S_{%s}$ Score" % s_beta)
 
     print("Fitting Reduced Dataset...")
     clf.fit(x_learn, y_learn)
 
     print("Predicting...")
-    predictions = [1 if p[1] > cutoff else 0 for p in clf.predict_proba(x_test)]
+    predictions = (clf.predict_proba(x_test)[:, 1] > cutoff).astype(int)
 
     if plot:
         try:
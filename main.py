@@ -1,31 +1,12 @@
 import datetime
-import pickle
 
 from breakdown import *
-from csv_reader.diagnose_csv import get_diagnoses
-from csv_reader.medication_csv import get_medications
-from csv_reader.mergers import *
-from csv_reader.patients_csv import get_patients
+from csv_reader.sites import add_diseases, add_medications, combine_sites, prepare_sites, prepare_site_data
+from csv_reader.store import write_store, load_store
 from practioner_analysis.practitioner import analyze_practitioners
 from simulations.simulations import compare_predictor_chads_vasc
 
 
-def add_diseases(patients, diagnoses_dict):
-    for patient_nr, diagnoses in diagnoses_dict.items():
-        for diagnosis in diagnoses:
-            patients[patient_nr].add_diagnosis(diagnosis)
-
-
-def add_medications(patients, medications_dict):
-    for patient_nr, medications in medications_dict.items():
-        for medication in medications:
-            try:
-                patients[patient_nr].add_medication(medication)
-            except KeyError:
-                print("Missing data, patient {}".format(patient_nr))
-                continue
-
-
 def get_all_diseases(diagnoses):
     diseases = set()
     for patient_nr, diagnosis in diagnoses.items():
@@ -54,58 +35,36 @@ def reduce_feature_space(diseases, diagnoses, min_frequency):
     return set(diseases)
 
 
-def prepare_data(dir, sep='\t'):
-    print("Reading CSV files...")
-    patients = get_patients("data/{}/patient_general.csv".format(dir), sep)
-    diagnoses = get_diagnoses("data/{}/patient_diagnoses.csv".format(dir), sep, merge=False)
-    medications = get_medications("data/{}/patient_meds.csv".format(dir), sep)
-
-    print("Linking data...")
-    add_diseases(patients, diagnoses)
-    add_medications(patients, medications)
+def site_files(dir):
+    return ("data/{}/patient_general.csv".format(dir), "data/{}/patient_diagnoses.csv".format(dir),
+            "data/{}/patient_meds.csv".format(dir))
 
-    print("Finding events...")
-    for p in patients.values():
-        p.set_care_range(extra_months=12)
-        p.find_strokes()
-        p.find_chads_vasc_changes()
 
-    return patients, diagnoses, medications
+def prepare_data(dir, sep='\t', coalesce=False):
+    return prepare_site_data(*site_files(dir), sep=sep, coalesce=coalesce)
 
 
-def pickle_data(data, fname):
-    pickle.dump(data, open("output/{}.pkl".format(fname), "wb"))
-
-
-def unpickle_data(fname):
-    return pickle.load(open("output/{}.pkl".format(fname), "rb"))
-
-
-def main(load_pickle=True):
+def main(load_stored=True):
     # compare_predictor_chads_vasc(None, None, None, None, load_from_file=True)
     # exit()
-    if load_pickle:
-        print("Loading data from Pickle files...")
-        patients_A, diagnoses_A, medications_A = unpickle_data("data_A")
-        patients_B, diagnoses_B, medications_B = unpickle_data("data_B")
-        patients, diagnoses, medications = unpickle_data("data_combined")
+    if load_stored:
+        print("Loading data from store files...")
+        sites = [load_store("output/data_A.npz"), load_store("output/data_B.npz")]
         print("Done.")
     else:
-        patients_A, diagnoses_A, medications_A = prepare_data("msc_A", sep='\t')
-        patients_B, diagnoses_B, medications_B = prepare_data("msc_B", sep='\t')
+        sites = prepare_sites([site_files("msc_A"), site_files("msc_B")], sep='\t')
+
+        print("Storing data...")
+        write_store("output/data_A.npz", sites[0].arrays)
+        write_store("output/data_B.npz", sites[1].arrays)
 
-        print("Merging data...")
-        patients = merge_data(patients_A, patients_B)
-        diagnoses = merge_data(diagnoses_A, diagnoses_B)
-        medications = merge_data(medications_A, medications_B)
+    patients_A, patients_B = sites
 
-        print("Total number of patients: {}".format(len(patients.keys())))
-        print("Number of female patients: {}".format(sum([1 if p.is_female() else 0 for p in patients.values()])))
+    print("Merging data...")
+    patients, diagnoses, medications = combine_sites(sites)
 
-        print("Pickling data...")
-        pickle_data([patients_A, diagnoses_A, medications_A], "data_A")
-        pickle_data([patients_B, diagnoses_B, medications_B], "data_B")
-        pickle_data([patients, diagnoses, medications], "data_combined")
+    print("Total number of patients: {}".format(len(patients.keys())))
+    print("Number of female patients: {}".format(sum([1 if p.is_female() else 0 for p in patients.values()])))
 
     diseases = get_all_diseases(diagnoses)
     plot_disease_frequency(diseases, diagnoses)
@@ -129,7 +88,7 @@ def main(load_pickle=True):
                           plot=True, fname_prefix="A_")
     analyze_practitioners(patients_B, start_prac, end_prac, spec="CAR", diag="401", meds_start_with="B01",
                           plot=True, fname_prefix="B_")
-    compare_predictor_chads_vasc(patients, diseases, start_ml, end_ml, load_from_file=False)
+    compare_predictor_chads_vasc(patients, diseases, start_ml, end_ml, load_from_file=False, processes=None)
 
 
     # asr = find_adjusted_stroke_rate(patients, start, end)
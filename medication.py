@@ -1,4 +1,6 @@
 class Medication:
+    __slots__ = ('code', 'start_date', 'end_date')
+
     def __init__(self, code, start_date, end_date):
         self.code = code
         self.start_date = start_date
@@ -11,4 +13,4 @@ class Medication:
         return self.start_date < other.start_date
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return self.code == other.code and self.start_date == other.start_date and self.end_date == other.end_date
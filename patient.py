@@ -1,4 +1,6 @@
 import datetime
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 
 from dateutil.relativedelta import relativedelta
 
@@ -15,9 +17,10 @@ class Patient:
 
         self.diagnoses = DiagnosesDict({})
         self.strokes = []
+        self.chads_vasc_changes = None
         self.care_range = (datetime.date(datetime.MAXYEAR, 12, 31), datetime.date(datetime.MINYEAR, 1, 1))  # TODO Unused
 
-        self.medications = {}
+        self.medications = MedicationsDict({})
 
     def __repr__(self):
         return "({}, {}, {}, {}\nDiseases: {})".format(self.number, self.sex, self.birth_date, self.death_date,
@@ -29,6 +32,7 @@ class Patient:
 
     def add_diagnosis(self, diagnosis):
         self.diagnoses.add(diagnosis)
+        self.chads_vasc_changes = None
 
         if self.death_date is not None and self.death_date is not datetime.date(datetime.MAXYEAR, 12, 31):
             if diagnosis.start_date > self.death_date:
@@ -43,28 +47,17 @@ class Patient:
         return current_diseases
 
     def has_disease(self, disease, timestamp, chronic=False):
-        if disease not in self.diagnoses:
-            return False
-
-        for d in self.diagnoses[disease]:
-            if (chronic and d.start_date <= timestamp) or d.start_date <= timestamp <= d.end_date:
-                return True
-        return False
+        return self.diagnoses.has_disease(disease, timestamp, chronic=chronic)
 
     def has_disease_group(self, group, timestamp, chronic=False):
         return any(map(lambda d: self.has_disease(d, timestamp, chronic=chronic), group))
 
     def days_since_diagnosis(self, disease, timestamp):
-        if disease not in self.diagnoses:
+        last_start = self.diagnoses.last_start(disease, timestamp)
+        if last_start is None:
             return 0
 
-        days = [(timestamp - d.start_date).days for d in self.diagnoses[disease]
-                if (timestamp - d.start_date).days >= 0]
-
-        if not days:
-            return 0
-
-        return min(days)
+        return (timestamp - last_start).days
 
     def days_since_last_diagnosis(self, timestamp):
         last_diagnosis = self.diagnoses.last_diagnosis
@@ -82,29 +75,47 @@ class Patient:
 
         return age
 
+    def birthday(self, age):
+        """ First date on which calculate_age() returns age, people born on February 29 turn a year older on March 1 """
+        try:
+            return self.birth_date.replace(year=self.birth_date.year + age)
+        except ValueError:
+            return datetime.date(self.birth_date.year + age, 3, 1)
+
     def is_female(self):
         return self.sex.lower() == "v" or self.sex.lower() == "f"
 
-    def calculate_chads_vasc(self, timestamp):
-        score = sum([
-            1 if self.has_disease_group(chads_vasc_c, timestamp, chronic=True) else 0,
-            1 if self.has_disease_group(chads_vasc_h, timestamp, chronic=True) else 0,
-            1 if self.has_disease_group(chads_vasc_d, timestamp, chronic=True) else 0,
-            2 if self.has_disease_group(chads_vasc_s, timestamp, chronic=True) else 0,
-            1 if self.has_disease_group(chads_vasc_v, timestamp, chronic=True) else 0
-        ])
-
-        age = self.calculate_age(timestamp)
+    def onset(self, group):
+        """ Start date of the first diagnosis of any disease in group, None if it was never diagnosed """
+        starts = [self.diagnoses.get_intervals(d)[0][0] for d in group if d in self.diagnoses]
+        return min(starts) if starts else None
+
+    def find_chads_vasc_changes(self):
+        """
+        The CHA2DS2-VASc score as a step function: the dates on which the score changes and the score from that date on.
+        The score only changes at the (chronic) onset of a category and on the 65th and 75th birthday.
+        """
+        changes = [(self.onset(group), points) for group, points in chads_vasc_groups]
+        changes += [(self.birthday(65), 1), (self.birthday(75), 1)]
+
+        base_score = 1 if self.is_female() else 0
+        dates, scores = [], []
+        for date, points in sorted(c for c in changes if c[0] is not None):
+            if dates and dates[-1] == date:
+                scores[-1] += points
+            else:
+                dates.append(date)
+                scores.append((scores[-1] if scores else base_score) + points)
+
+        self.chads_vasc_changes = (dates, scores, base_score)
 
-        if age >= 75:
-            score += 2
-        elif age >= 65:
-            score += 1
-
-        if self.is_female():
-            score += 1
+    def calculate_chads_vasc(self, timestamp):
+        if self.chads_vasc_changes is None:
+            self.find_chads_vasc_changes()
 
-        return score
+        dates, scores, base_score = self.chads_vasc_changes
+        i = bisect_right(dates, timestamp)
+        return scores[i - 1] if i > 0 else base_score
 
     def should_have_AC(self, timestamp, method, **kwargs):
         return method(self, timestamp, **kwargs)
@@ -115,42 +126,44 @@ class Patient:
         return False
 
     def find_strokes(self):
-
-        timestamps = []
+        """ Sorted start dates of the stroke diagnoses, a date is only listed once """
+        timestamps = set()
         for s in stroke_diseases:
             if s not in self.diagnoses:
                 continue
 
             for d in self.diagnoses[s]:
-                timestamps.append(d.start_date)
+                timestamps.add(d.start_date)
+
+        self.strokes = sorted(timestamps)
 
-        self.strokes = timestamps
+    def next_stroke(self, timestamp):
+        """ First stroke after timestamp, None if there is none """
+        i = bisect_right(self.strokes, timestamp)
+        return self.strokes[i] if i < len(self.strokes) else None
 
     def add_medication(self, medication):
-        if medication.code not in self.medications:
-            self.medications[medication.code] = []
-        self.medications[medication.code].append(medication)
+        self.medications.add(medication)
 
     def has_medication(self, medication_code, sim_date):
-        for m in self.medications[medication_code]:
-            if m.start_date <= sim_date <= m.end_date:
-                return True
-        return False
+        return self.medications.last_active_start(medication_code, sim_date) is not None
 
     def has_medication_group(self, starts_with, sim_date, which=False):
         last = None
         last_date = datetime.date(datetime.MINYEAR, 1, 1)
-        for code, medications in self.medications.items():
-            if not code.startswith(starts_with):
+        for code in self.medications.codes_starting_with(starts_with):
+            start_date = self.medications.last_active_start(code, sim_date)
+            if start_date is None:
                 continue
+            if not which:
+                return True
+
+            # On equal start dates the code that was added first wins
+            if start_date > last_date or (start_date == last_date and
+                                          self.medications.rank(code) < self.medications.rank(last)):
+                last_date = start_date
+                last = code
 
-            for m in medications:
-                if m.start_date <= sim_date <= m.end_date:
-                    if not which:
-                        return True
-                    elif m.start_date > last_date:
-                        last_date = m.start_date
-                        last = code
         if which and last is not None:
             return last
         return False
@@ -183,6 +196,10 @@ class DiagnosesDict(dict):
         super(DiagnosesDict, self).__init__(*args, **kw)
         self.last_diagnosis = None
 
+        # Per disease the sorted start dates and the running maximum of the end dates in that order,
+        # built on the first query after a diagnosis of that disease was added
+        self._intervals = {}
+
     def add(self, diagnosis):
         if not type(diagnosis) is Diagnosis:
             raise(TypeError, "Type is not a Diagnosis")
@@ -191,11 +208,90 @@ class DiagnosesDict(dict):
         if disease not in self.keys():
             super(DiagnosesDict, self).__setitem__(disease, [])
         self[disease].append(diagnosis)
+        self._intervals.pop(disease, None)
         if self.last_diagnosis is None or self.last_diagnosis < diagnosis:
             self.last_diagnosis = diagnosis
 
+    def get_intervals(self, disease):
+        intervals = self._intervals.get(disease)
+        if intervals is None:
+            diagnoses = sorted(self[disease])
+            intervals = ([d.start_date for d in diagnoses], list(accumulate((d.end_date for d in diagnoses), max)))
+            self._intervals[disease] = intervals
+        return intervals
+
+    def has_disease(self, disease, timestamp, chronic=False):
+        if disease not in self:
+            return False
+
+        starts, max_ends = self.get_intervals(disease)
+        i = bisect_right(starts, timestamp)
+        if i == 0:
+            return False
+
+        # Chronic only needs a start before the timestamp, otherwise any of those diagnoses should still be running
+        return chronic or max_ends[i - 1] >= timestamp
+
+    def last_start(self, disease, timestamp):
+        """ Start date of the most recent diagnosis of disease started on or before timestamp """
+        if disease not in self:
+            return None
+
+        starts, _ = self.get_intervals(disease)
+        i = bisect_right(starts, timestamp)
+        return starts[i - 1] if i > 0 else None
+
     def iter_diagnoses(self):
         for diagnoses in self.values():
             for diagnosis in diagnoses:
                 yield diagnosis
 
+
+class MedicationsDict(dict):
+    def __init__(self, *args, **kw):
+        super(MedicationsDict, self).__init__(*args, **kw)
+
+        # All codes in sorted order and per code the medications sorted on start date with the running maximum
+        # of their end dates, both built on the first query after a medication was added
+        self._codes = None
+        self._ranks = None
+        self._intervals = {}
+
+    def add(self, medication):
+        code = medication.code
+        if code not in self.keys():
+            super(MedicationsDict, self).__setitem__(code, [])
+            self._codes = self._ranks = None
+        self[code].append(medication)
+        self._intervals.pop(code, None)
+
+    def codes_starting_with(self, prefix):
+        if self._codes is None:
+            self._codes = sorted(self.keys())
+        return self._codes[bisect_left(self._codes, prefix):bisect_left(self._codes, prefix + chr(0x10ffff))]
+
+    def rank(self, code):
+        """ Position of code in the order the codes were added """
+        if self._ranks is None:
+            self._ranks = {c: i for i, c in enumerate(self.keys())}
+        return self._ranks[code]
+
+    def get_intervals(self, code):
+        intervals = self._intervals.get(code)
+        if intervals is None:
+            medications = sorted(self[code])
+            intervals = ([m.start_date for m in medications], [m.end_date for m in medications],
+                         list(accumulate((m.end_date for m in medications), max)))
+            self._intervals[code] = intervals
+        return intervals
+
+    def last_active_start(self, code, timestamp):
+        """ Start date of the most recently started medication of code that is active on timestamp, if any """
+        starts, ends, max_ends = self.get_intervals(code)
+
+        i = bisect_right(starts, timestamp) - 1
+        while i >= 0 and max_ends[i] >= timestamp:
+            if ends[i] >= timestamp:
+                return starts[i]
+            i -= 1
+        return None
@@ -1,17 +1,29 @@
 import numpy as np
+import scipy.sparse
 import timeit
 import datetime
 import random
-from collections import Counter
+import os
+from collections import Counter, namedtuple
+from multiprocessing import Pool, cpu_count
 from matplotlib.pyplot import cm
 
 from dateutil.relativedelta import relativedelta
 
-from anticoagulant_decision import future_stroke, chads_vasc
+from anticoagulant_decision import future_stroke, decision_rules, evaluate_rules
+from cohort import Cohort
+from csv_reader.reader import date_array
+from csv_reader.store import PatientStore, store_arrays
+from disease import disease_registry
 from disease_groups import *
 from learning.confusion_matrix import ConfusionMatrix
 from learning.predictor import predict, plot_matrices
 
+NEVER_DIAGNOSED = 10000
+EXPORT_DIRECTORY = "output/learning"
+EXPORT_CHUNK_SIZE = 100000
+CHADS_VASC_RULE = "CHA2DS2-VASc >= 2"  # Registered rule giving chads_vasc_pred of a Simulation
+
 
 def get_chads_vasc_feature(patient, sim_date):
     groups = [chads_vasc_c, chads_vasc_h, chads_vasc_d, chads_vasc_s, chads_vasc_v]
@@ -27,7 +39,7 @@ def get_chads_vasc_feature(patient, sim_date):
 def get_feature_slice(diseases, patient, sim_date, days_since=True):
     if days_since:
         x = [patient.days_since_diagnosis(d, sim_date) if patient.has_disease(d, sim_date, chronic=True)
-             else 10000 for i, d in enumerate(diseases)]
+             else NEVER_DIAGNOSED for i, d in enumerate(diseases)]
     else:
         x = [1 if patient.has_disease(d, sim_date, chronic=True) else 0 for d in diseases]
 
@@ -39,8 +51,90 @@ def get_feature_slice(diseases, patient, sim_date, days_since=True):
     return x, y
 
 
+def get_feature_matrix(diseases, patient_dates, days_since=True, sparse=False, out=None):
+    """
+    The rows get_feature_slice() gives (without y) for every (patient, sim_date) pair. Every patient's diagnosed
+    diseases are carried forward from one of its dates to the next, only diagnoses started in between change them.
+    With sparse a CSR matrix is returned. The days since encoding then stores NEVER_DIAGNOSED - days, so the implicit
+    zero means never diagnosed and the order of the values is kept, see decode_days_since().
+    Otherwise the rows are written into out (for example a memory map) when given.
+    """
+    if sparse and out is not None:
+        raise ValueError("Only a dense feature matrix can be written into out")
+
+    columns = {d: i for i, d in enumerate(diseases)}
+    n_rows, n_columns = len(patient_dates), len(diseases) + 2
+
+    patient_rows = {}
+    for i, (patient, _) in enumerate(patient_dates):
+        patient_rows.setdefault(patient.number, (patient, []))[1].append(i)
+
+    x = None
+    if not sparse:
+        x = np.empty((n_rows, n_columns), dtype=np.int64) if out is None else out
+        x[:, :-2] = NEVER_DIAGNOSED if days_since else 0
+    row_columns = [None] * n_rows
+    row_values = [None] * n_rows
+    female = np.zeros(n_rows, dtype=np.int64)
+    ages = np.zeros(n_rows, dtype=np.int64)
+
+    for patient, rows in patient_rows.values():
+        events = sorted((start_date, columns[d]) for d in patient.diagnoses if d in columns
+                        for start_date in patient.diagnoses.get_intervals(d)[0])
+
+        # Column -> start of the last diagnosis so far, as arrays sorted on column
+        last_starts = {}
+        cols = np.empty(0, dtype=np.int64)
+        starts = np.empty(0, dtype=np.int64)
+
+        e = 0
+        for i in sorted(rows, key=lambda r: patient_dates[r][1]):
+            sim_date = patient_dates[i][1]
+            if e < len(events) and events[e][0] <= sim_date:
+                while e < len(events) and events[e][0] <= sim_date:
+                    last_starts[events[e][1]] = events[e][0]
+                    e += 1
+                cols = np.array(sorted(last_starts), dtype=np.int64)
+                starts = np.array([last_starts[c].toordinal() for c in cols.tolist()], dtype=np.int64)
+
+            if sparse:
+                row_columns[i] = cols
+                row_values[i] = NEVER_DIAGNOSED - (sim_date.toordinal() - starts) if days_since else \
+                    np.ones(len(cols), dtype=np.int64)
+            else:
+                x[i, cols] = sim_date.toordinal() - starts if days_since else 1
+
+            female[i] = patient.is_female()
+            ages[i] = patient.calculate_age(sim_date)
+
+    if not sparse:
+        x[:, -2] = female
+        x[:, -1] = ages
+        return x
+
+    indices, data, counts = [], [], np.empty(n_rows, dtype=np.int64)
+    for i, cols in enumerate(row_columns):
+        extra = [len(diseases), len(diseases) + 1] if female[i] else [len(diseases) + 1]
+        indices += [cols, extra]
+        data += [row_values[i], [1, ages[i]] if female[i] else [ages[i]]]
+        counts[i] = len(cols) + len(extra)
+
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+    return scipy.sparse.csr_matrix((np.concatenate(data).astype(np.int64) if data else np.empty(0, dtype=np.int64),
+                                    np.concatenate(indices).astype(np.int64) if indices else
+                                    np.empty(0, dtype=np.int64),
+                                    indptr), shape=(n_rows, n_columns))
+
+
+def decode_days_since(x):
+    """ Dense days since feature rows from a sparse matrix get_feature_matrix() gives with days_since """
+    x = x.toarray()
+    x[:, :-2] = NEVER_DIAGNOSED - x[:, :-2]
+    return x
+
+
 def get_feature_labels(diseases):
-    """ Make sure that this function is in line with get_feature_slice() """
+    """ Make sure that this function is in line with get_feature_slice() and get_feature_matrix() """
     labels = [str(d) for d in diseases]
     labels += ["Gender", "Age"]
 
@@ -59,175 +153,424 @@ def get_patient_subset(patients, stroke_patient_rate=0.5, seed=None):
 
     half_learn_size = int(len(positive_patients) * stroke_patient_rate)
 
-    if seed:
-        random.seed(seed)
-    random.shuffle(positive_patients)
-    random.shuffle(negative_patients)
+    rng = random.Random(seed)
+    rng.shuffle(positive_patients)
+    rng.shuffle(negative_patients)
 
     learn_set = positive_patients[:half_learn_size] + negative_patients[0:half_learn_size]
     return learn_set
 
 
-def patient_month_generator(patients, start, end, step=1, include_meds=False):
-    sim_date = start
-    # TODO: move split to other somewhere else
+class PatientSplit:
+    """ Learn/test split of the patients, every patient that is not in the learn set is in the test set """
+    def __init__(self, learn_set, seed=None):
+        self.learn_set = frozenset(learn_set)
+        self.seed = seed
 
-    test_set = get_patient_subset(patients)
-    while sim_date < end:
-        for patient_nr, patient in patients.items():
-            # Excluded patients are either:
-            #  - Not alive
-            #  - Don't have atrial fib (yet)
-            #  - Last diagnosis was more than a year ago
-            #  - Receive Antithrombotics
-            if patient.is_alive(sim_date) \
-               and patient.has_disease_group(atrial_fib, sim_date, chronic=True) \
-               and patient.days_since_last_diagnosis(sim_date) <= 365 \
-               and (not patient.has_medication_group("B01", sim_date) or include_meds):  # Antithrombotic Agents start with B01
-                yield patient, sim_date, patient_nr not in test_set
+    @classmethod
+    def from_patients(cls, patients, stroke_patient_rate=0.5, seed=None):
+        if seed is None:
+            seed = random.randint(0, 1000000)
+        return cls(get_patient_subset(patients, stroke_patient_rate=stroke_patient_rate, seed=seed), seed=seed)
 
-        sim_date += relativedelta(months=+step)
+    def in_test_set(self, patient_nr):
+        return patient_nr not in self.learn_set
 
+    def save(self, fname):
+        with open(fname, "wb") as f:
+            # None can't be stored without pickling, a missing seed is marked by has_seed instead
+            np.savez(f, learn_set=np.array(sorted(self.learn_set), dtype=np.int64),
+                     seed=np.array(0 if self.seed is None else self.seed, dtype=np.int64),
+                     has_seed=np.array(self.seed is not None))
 
-def simulate_predictor(patients, diseases, start, end, day_since=True, chads_vasc_features=False):
-    x_learn, y_learn, x_test, y_test = [], [], [], []
-    learn_groups, scores = [], []
+    @classmethod
+    def load(cls, fname):
+        with np.load(fname, allow_pickle=False) as data:
+            return cls(data['learn_set'].tolist(), seed=data['seed'].item() if data['has_seed'] else None)
 
-    if chads_vasc_features:
+
+def simulation_dates(start, end, step=1):
+    dates = []
+    sim_date = start
+    while sim_date < end:
+        dates.append(sim_date)
+        sim_date += relativedelta(months=+step)
+
+    return dates
+
+
+def eligible_patient_months(cohort, dates, include_meds=False):
+    """ Month and row indexes of the eligible (patient, month) pairs, ordered on month and then on patient """
+    # Excluded patients are either:
+    #  - Not alive
+    #  - Don't have atrial fib (yet)
+    #  - Last diagnosis was more than a year ago
+    #  - Receive Antithrombotics
+    eligible = cohort.eligible(dates, include_meds=include_meds)
+    return np.nonzero(eligible.T)
+
+
+def patient_month_generator(patients, start, end, step=1, include_meds=False, cohort=None, split=None):
+    if split is None:
+        split = PatientSplit.from_patients(patients)
+    if cohort is None:
+        cohort = Cohort(patients)
+    dates = simulation_dates(start, end, step)
+
+    numbers = cohort.numbers.tolist()
+    for month, row in zip(*eligible_patient_months(cohort, dates, include_meds=include_meds)):
+        patient_nr = numbers[row]
+        yield patients[patient_nr], dates[month], split.in_test_set(patient_nr)
+
+
+Simulation = namedtuple('Simulation', ['x', 'y', 'scores', 'chads_vasc_pred', 'groups', 'in_test_set', 'dates',
+                                       'decisions', 'labels'])
+
+
+def simulation_array(directory, name, shape, dtype):
+    """ A new array, or with directory a memory map of the preallocated file simulation_<name>.npy in directory """
+    if directory is None:
+        return np.empty(shape, dtype=dtype)
+    os.makedirs(directory, exist_ok=True)
+    return np.lib.format.open_memmap(os.path.join(directory, "simulation_{}.npy".format(name)), mode='w+',
+                                     dtype=dtype, shape=shape)
+
+
+def simulate(patients, diseases, start, end, split=None, day_since=True, chads_vasc_features=False, features=True,
+             cohort=None, rules=(), directory=None):
+    """
+    One pass over the eligible patient months filling a row per patient month for both the CHA2DS2-VASc and the
+    predictor simulations: the feature row (only if features), the future stroke label, the CHA2DS2-VASc score and
+    decision, the patient number, whether the patient is in the test set, the simulation date and for every name in
+    rules (registered decision rules, see anticoagulant_decision) its decision.
+    With directory x, y and scores are memory maps of files in directory, see simulation_array().
+    """
+    if split is None:
+        split = PatientSplit.from_patients(patients)
+    if cohort is None:
+        cohort = Cohort(patients)
+    dates = simulation_dates(start, end)
+
+    months, rows = eligible_patient_months(cohort, dates)
+    groups = cohort.numbers[rows]
+    chads_vasc_scores = cohort.chads_vasc(dates).score[rows, months]
+    scores = simulation_array(directory, "scores", chads_vasc_scores.shape, chads_vasc_scores.dtype)
+    scores[:] = chads_vasc_scores
+    in_test_set = np.array([split.in_test_set(patient_nr) for patient_nr in groups.tolist()], dtype=bool)
+
+    if not features:
+        labels = None
+    elif chads_vasc_features:
         labels = ["C", "H", "D", "S", "V", "Gender", "Age"]
     else:
         labels = get_feature_labels(diseases)
 
+    patient_dates = [(patients[patient_nr], dates[month])
+                     for patient_nr, month in zip(groups.tolist(), months.tolist())]
+
+    x = None
+    if features:
+        x = simulation_array(directory, "x", (len(rows), len(labels)), np.int64)
+    if features and not chads_vasc_features:
+        get_feature_matrix(diseases, patient_dates, days_since=day_since, out=x)
+    elif features:
+        for i, (patient, sim_date) in enumerate(patient_dates):
+            x[i], _ = get_chads_vasc_feature(patient, sim_date)
+
+    future_strokes = cohort.future_stroke(dates, months=12)[rows, months]
+    y = simulation_array(directory, "y", future_strokes.shape, future_strokes.dtype)
+    y[:] = future_strokes
+    decisions = {name: decided[rows, months] for name, decided in evaluate_rules(cohort, dates, rules).items()}
+
+    # The rule's threshold on the scores computed above, instead of scoring the cohort again in decide_cohort()
+    chads_vasc_pred = scores >= decision_rules[CHADS_VASC_RULE].threshold
+    return Simulation(x, y, scores, chads_vasc_pred, groups, in_test_set, date_array(dates)[months], decisions, labels)
+
+
+def _simulate_shard(job):
+    shard, arrays, diseases, start, end, split, kwargs = job
+    # Diseases are send as (spec, diag, description) to share the instances of the worker's disease_registry
+    if diseases is not None:
+        diseases = [disease_registry.get(spec, diag, description=description) for spec, diag, description in diseases]
+    return shard, simulate(PatientStore(arrays), diseases, start, end, split=split, **kwargs)
+
+
+def simulate_parallel(patients, diseases, start, end, split=None, processes=None, shards_per_process=4,
+                      directory=None, cohort=None, **kwargs):
+    """
+    simulate() with the patients sharded over worker processes. The shards are send as store arrays instead of
+    the linked patient objects. The rows of the result are laid out beforehand from the eligible patient months of
+    the cohort, every shard is written to its rows as soon as it is done and dropped after. With directory x, y and
+    scores are memory maps of files in directory, as simulate() gives them.
+    """
+    if split is None:
+        split = PatientSplit.from_patients(patients)
+    if processes is None:
+        processes = cpu_count()
+    if cohort is None:
+        cohort = Cohort(patients)
+
+    numbers = list(patients.keys())
+    if not numbers:
+        return simulate(patients, diseases, start, end, split=split, directory=directory, cohort=cohort, **kwargs)
+    shards = [shard.tolist() for shard in np.array_split(np.arange(len(numbers)), processes * shards_per_process)
+              if len(shard)]
+
+    # Same order as simulate(): on date and then on the position of the patient in patients. A shard keeps that
+    # order within its own rows, so its rows go to the rows of its patients in order.
+    dates = simulation_dates(start, end)
+    months, rows = eligible_patient_months(cohort, dates)
+    shard_of_patient = np.empty(len(numbers), dtype=np.int64)
+    for k, shard in enumerate(shards):
+        shard_of_patient[shard] = k
+    row_shards = shard_of_patient[rows]
+
+    def jobs():
+        shard_diseases = None if diseases is None else [(d.spec, d.diag, d.description) for d in diseases]
+        for k, shard in enumerate(shards):
+            shard_patients = {numbers[i]: patients[numbers[i]] for i in shard}
+            diagnoses = {n: list(p.diagnoses.iter_diagnoses()) for n, p in shard_patients.items() if p.diagnoses}
+            medications = {n: [m for ms in p.medications.values() for m in ms]
+                           for n, p in shard_patients.items() if p.medications}
+            yield k, store_arrays(shard_patients, diagnoses, medications), shard_diseases, start, end, split, kwargs
+
+    arrays, decisions, labels = {}, {}, None
+
+    def write(store, name, values, destination, directory=None):
+        if name not in store:
+            store[name] = simulation_array(directory, name, (len(rows),) + values.shape[1:], values.dtype)
+        store[name][destination] = values
+
+    with Pool(processes=processes) as pool:
+        for k, simulation in pool.imap_unordered(_simulate_shard, jobs()):
+            destination = np.flatnonzero(row_shards == k)
+            for field in ['x', 'y', 'scores']:
+                if getattr(simulation, field) is not None:
+                    write(arrays, field, getattr(simulation, field), destination, directory=directory)
+            for field in ['chads_vasc_pred', 'groups', 'in_test_set', 'dates']:
+                write(arrays, field, getattr(simulation, field), destination)
+            for name, decided in simulation.decisions.items():
+                write(decisions, name, decided, destination)
+            labels = simulation.labels
+            del simulation
+
+    return Simulation(arrays.get('x'), arrays['y'], arrays['scores'], arrays['chads_vasc_pred'], arrays['groups'],
+                      arrays['in_test_set'], arrays['dates'], decisions, labels)
+
+
+def predictor_data(simulation):
+    learn, test = ~simulation.in_test_set, simulation.in_test_set
+    return (simulation.x[learn], simulation.y[learn], simulation.x[test], simulation.y[test],
+            simulation.labels, simulation.groups[learn], simulation.scores[test])
+
+
+def chads_vasc_data(simulation, only_test_set=False):
+    rows = simulation.in_test_set if only_test_set else slice(None)
+    return simulation.chads_vasc_pred[rows].astype(int), simulation.y[rows].astype(int), simulation.scores[rows]
+
+
+def run_simulation(patients, diseases, start, end, processes=1, **kwargs):
+    """ simulate() in this process when processes is 1, otherwise simulate_parallel() (None uses every core) """
+    if processes == 1:
+        return simulate(patients, diseases, start, end, **kwargs)
+    return simulate_parallel(patients, diseases, start, end, processes=processes, **kwargs)
+
+
+def simulate_predictor(patients, diseases, start, end, day_since=True, chads_vasc_features=False, split=None,
+                       processes=1):
     print("Simulating Predictor...\nStart Date: {}\nEnd Date: {}".format(start, end))
     start_timer = timeit.default_timer()
 
-    for patient, sim_date, in_test_set in patient_month_generator(patients, start, end):
-        if chads_vasc_features:
-            x, y = get_chads_vasc_feature(patient, sim_date)
-        else:
-            x, y = get_feature_slice(diseases, patient, sim_date, days_since=day_since)
-
-        if in_test_set:
-            x_test.append(x)
-            y_test.append(y)
-            scores.append(patient.calculate_chads_vasc(sim_date))
-        else:
-            x_learn.append(x)
-            y_learn.append(y)
-            learn_groups.append(patient.number)
+    simulation = run_simulation(patients, diseases, start, end, processes=processes, split=split,
+                                day_since=day_since, chads_vasc_features=chads_vasc_features)
 
     stop_timer = timeit.default_timer()
     print("Time elapsed: {}".format(stop_timer - start_timer))
 
-    return x_learn, y_learn, x_test, y_test, labels, learn_groups, scores
+    return predictor_data(simulation)
 
 
-def simulate_chads_vasc(patients, start, end, only_test_set=False):
-    x, y, scores = [], [], []
+def simulate_chads_vasc(patients, start, end, only_test_set=False, split=None, processes=1):
     print("Simulating CHADS-Vasc...\nStart Date: {}\nEnd Date: {}".format(start, end))
-    for patient, sim_date, in_test_set in patient_month_generator(patients, start, end):
-        if only_test_set and not in_test_set:
-            continue
-        x.append(1 if patient.should_have_AC(sim_date, chads_vasc, max_value=2) else 0)
-        y.append(1 if patient.should_have_AC(sim_date, future_stroke, months=12) else 0)
-        scores.append(patient.calculate_chads_vasc(sim_date))
-    return x, y, scores
-
-
-def get_group_dict(score_groups, y_true, y_pred, scores):
-    print(score_groups)
-    score_group_map = {}
-    for i in range(10):
-        index = -1
-        for j, g in enumerate(score_groups):
-            if i in g:
-                index = j
-                break
+    simulation = run_simulation(patients, None, start, end, processes=processes, split=split, features=False)
+    return chads_vasc_data(simulation, only_test_set=only_test_set)
+
+
+def score_bands(scores, score_groups):
+    """
+    Index of the score group every score is in. Scores that are in none of them, above, below or in between the
+    groups, are in an extra other band with index len(score_groups).
+    """
+    scores = np.asarray(scores, dtype=np.int64)
+    size = max([int(scores.max()) + 1 if len(scores) else 0] + [max(g) + 1 for g in score_groups])
+
+    band_of_score = np.full(size, len(score_groups), dtype=np.int64)
+    for j, g in reversed(list(enumerate(score_groups))):
+        band_of_score[g] = j
+    return band_of_score[scores]
+
+
+def score_band_labels(score_groups):
+    """ Labels of the bands score_bands() gives, the last one is the other band """
+    return ["{} - {}".format(l[0], l[-1]) if len(l) > 1 else str(l[0]) for l in score_groups] + ["Other"]
+
+
+def grouped_counts(models, score_groups, strata=None):
+    """
+    Confusion matrix counts of every model per score band and stratum, counted with a single bincount.
+    models holds a (y_true, y_pred, scores) tuple per model, strata (optional) per model an array with the stratum
+    (sex, age band, hospital, ...) of every row. Returns an array of shape (models, bands, strata, 4) with the counts
+    in the order of ConfusionMatrix.matrix and the sorted stratum values, [None] without strata.
+    """
+    n_bands = len(score_groups) + 1
+    if strata is None:
+        stratum_values = [None]
+        strata = [np.zeros(len(np.asarray(m[0])), dtype=np.int64) for m in models]
+    else:
+        stratum_values, inverse = np.unique(np.concatenate([np.asarray(s) for s in strata]), return_inverse=True)
+        stratum_values = stratum_values.tolist()
+        strata = np.split(inverse, np.cumsum([len(s) for s in strata])[:-1])
+
+    keys = []
+    for i, ((true, pred, scores), stratum) in enumerate(zip(models, strata)):
+        true, pred = np.asarray(true) == 1, np.asarray(pred) == 1
+        # 0 true positive, 1 false negative, 2 false positive, 3 true negative
+        cell = 2 * ~true + ~pred
+        group = (i * n_bands + score_bands(scores, score_groups)) * len(stratum_values) + stratum
+        keys.append(group * 4 + cell)
+
+    size = len(models) * n_bands * len(stratum_values) * 4
+    counts = np.bincount(np.concatenate(keys) if keys else np.empty(0, dtype=np.int64), minlength=size)
+    return counts.reshape(len(models), n_bands, len(stratum_values), 4), stratum_values
+
+
+def get_grouped_matrices(models, score_groups, names, strata=None):
+    """
+    Confusion matrices per score band (and stratum), for every band (and stratum) one per model. The other band of
+    score_bands() is left out when none of the scores are in it.
+    """
+    counts, stratum_values = grouped_counts(models, score_groups, strata=strata)
 
-        score_group_map[i] = index if index >= 0 else len(score_groups)
+    cms = []
+    for i, l in enumerate(score_band_labels(score_groups)):
+        if i == len(score_groups) and not counts[:, i].any():
+            continue
+        for k, stratum in enumerate(stratum_values):
+            group = l if stratum is None else "{} {}".format(l, stratum)
+            for j, name in enumerate(names):
+                t_p, f_n, f_p, t_n = counts[j, i, k].tolist()
+                print("Group {}\t#Positive: {}\tTotal: {}".format(group, t_p + f_n, t_p + f_n + f_p + t_n))
+                cms.append(ConfusionMatrix.from_counts(t_p, f_n, f_p, t_n, name="{} {}".format(group, name)))
 
-    grouped = {k: ([], []) for k in range(len(score_groups) + 1)}
-    print(grouped)
-    print(score_group_map)
-    for true, pred, score in zip(y_true, y_pred, scores):
-        index = score_group_map[score]
-        grouped[index][0].append(true)
-        grouped[index][1].append(pred)
+    return cms
 
-    return grouped
 
+def save_array(fname, values, rows=None, dtype=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Write values to a .npy file through a memory map of the preallocated file, chunk_size rows at the time.
+    With rows, a boolean mask, only the selected rows are written. values can be a memory map itself.
+    """
+    values = values if isinstance(values, np.ndarray) else np.asarray(values)
+    n = len(values) if rows is None else int(np.count_nonzero(rows))
 
-def get_grouped_matrices(models, score_groups, names):
-    max_score = score_groups[-1][-1]
-    score_labels = ["{} - {}".format(l[0], l[-1]) if len(l) > 1 else str(l[0]) for l in score_groups] + \
-                   ["$\geq${}".format(max_score + 1)]
+    out = np.lib.format.open_memmap(fname, mode='w+', dtype=dtype or values.dtype, shape=(n,) + values.shape[1:])
+    position = 0
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        if rows is not None:
+            chunk = chunk[rows[start:start + chunk_size]]
+        out[position:position + len(chunk)] = chunk
+        position += len(chunk)
 
-    grouped_data = []
-    for true, pred, scores in models:
-        grouped_data.append(get_group_dict(score_groups, true, pred, scores))
+    out.flush()
+    del out
 
-    cms = []
-    for i, l in enumerate(score_labels):
-        for j, g in enumerate(grouped_data):
-            print("Group {}\t#Positive: {}\tTotal: {}".format(l, sum(g[i][0]), len(g[i][0])))
-            cms.append(ConfusionMatrix(g[i][0], g[i][1], name="{} {}".format(l, names[j])))
 
-    return cms
+def load_array(fname, mmap_mode='r'):
+    return np.load(fname, mmap_mode=mmap_mode, allow_pickle=False)
 
 
-def export_chads_vasc_data(ypred, y, scores):
-    np.save("output/learning/ypred_chads_vasc", ypred)
-    np.save("output/learning/y_chads_vasc", y)
-    np.save("output/learning/chads_vasc_scores", scores)
+def export_chads_vasc_data(ypred, y, scores, directory=EXPORT_DIRECTORY):
+    save_array(os.path.join(directory, "ypred_chads_vasc.npy"), ypred)
+    save_array(os.path.join(directory, "y_chads_vasc.npy"), y)
+    save_array(os.path.join(directory, "chads_vasc_scores.npy"), scores)
 
 
-def import_chads_vasc_data():
-    ypred = np.load("output/learning/ypred_chads_vasc.npy")
-    y = np.load("output/learning/y_chads_vasc.npy")
-    scores = np.load("output/learning/chads_vasc_scores.npy")
+def import_chads_vasc_data(directory=EXPORT_DIRECTORY, mmap_mode='r'):
+    ypred = load_array(os.path.join(directory, "ypred_chads_vasc.npy"), mmap_mode=mmap_mode)
+    y = load_array(os.path.join(directory, "y_chads_vasc.npy"), mmap_mode=mmap_mode)
+    scores = load_array(os.path.join(directory, "chads_vasc_scores.npy"), mmap_mode=mmap_mode)
 
     return ypred, y, scores
 
 
-def export_predictor_data(x_learn, y_learn, x_test, y_test, labels, learn_groups, test_scores):
-    np.save("output/learning/x_learn", x_learn)
-    np.save("output/learning/y_learn", y_learn)
-    np.save("output/learning/x_test", x_test)
-    np.save("output/learning/y_test", y_test)
-    np.save("output/learning/labels", labels)
-    np.save("output/learning/learn_groups", learn_groups)
-    np.save("output/learning/test_scores", test_scores)
-
-
-def import_predictor_data():
-    x_learn = np.load("output/learning/x_learn.npy").tolist()
-    y_learn = np.load("output/learning/y_learn.npy").tolist()
-    x_test = np.load("output/learning/x_test.npy").tolist()
-    y_test = np.load("output/learning/y_test.npy").tolist()
-    labels = np.load("output/learning/labels.npy").tolist()
-    learn_groups = np.load("output/learning/learn_groups.npy").tolist()
-    test_scores = np.load("output/learning/test_scores.npy").tolist()
+def export_predictor_data(x_learn, y_learn, x_test, y_test, labels, learn_groups, test_scores,
+                          directory=EXPORT_DIRECTORY):
+    save_array(os.path.join(directory, "x_learn.npy"), x_learn)
+    save_array(os.path.join(directory, "y_learn.npy"), y_learn)
+    save_array(os.path.join(directory, "x_test.npy"), x_test)
+    save_array(os.path.join(directory, "y_test.npy"), y_test)
+    save_array(os.path.join(directory, "labels.npy"), labels)
+    save_array(os.path.join(directory, "learn_groups.npy"), learn_groups)
+    save_array(os.path.join(directory, "test_scores.npy"), test_scores)
+
+
+def export_simulation(simulation, directory=EXPORT_DIRECTORY):
+    """
+    Writes the files of export_chads_vasc_data() (test set only) and export_predictor_data() straight from the
+    simulation arrays, without making the learn and test copies in memory first
+    """
+    learn, test = ~simulation.in_test_set, simulation.in_test_set
+
+    save_array(os.path.join(directory, "ypred_chads_vasc.npy"), simulation.chads_vasc_pred, rows=test, dtype=int)
+    save_array(os.path.join(directory, "y_chads_vasc.npy"), simulation.y, rows=test, dtype=int)
+    save_array(os.path.join(directory, "chads_vasc_scores.npy"), simulation.scores, rows=test)
+
+    save_array(os.path.join(directory, "x_learn.npy"), simulation.x, rows=learn)
+    save_array(os.path.join(directory, "y_learn.npy"), simulation.y, rows=learn)
+    save_array(os.path.join(directory, "x_test.npy"), simulation.x, rows=test)
+    save_array(os.path.join(directory, "y_test.npy"), simulation.y, rows=test)
+    save_array(os.path.join(directory, "labels.npy"), simulation.labels)
+    save_array(os.path.join(directory, "learn_groups.npy"), simulation.groups, rows=learn)
+    save_array(os.path.join(directory, "test_scores.npy"), simulation.scores, rows=test)
+
+
+def import_predictor_data(directory=EXPORT_DIRECTORY, mmap_mode='r'):
+    """ The arrays are memory mapped (unless mmap_mode is None), only the labels are read into a list """
+    x_learn = load_array(os.path.join(directory, "x_learn.npy"), mmap_mode=mmap_mode)
+    y_learn = load_array(os.path.join(directory, "y_learn.npy"), mmap_mode=mmap_mode)
+    x_test = load_array(os.path.join(directory, "x_test.npy"), mmap_mode=mmap_mode)
+    y_test = load_array(os.path.join(directory, "y_test.npy"), mmap_mode=mmap_mode)
+    labels = load_array(os.path.join(directory, "labels.npy"), mmap_mode=None).tolist()
+    learn_groups = load_array(os.path.join(directory, "learn_groups.npy"), mmap_mode=mmap_mode)
+    test_scores = load_array(os.path.join(directory, "test_scores.npy"), mmap_mode=mmap_mode)
 
     return x_learn, y_learn, x_test, y_test, labels, learn_groups, test_scores
 
 
-def compare_predictor_chads_vasc(patients, diseases, start, end, load_from_file=False):
+def compare_predictor_chads_vasc(patients, diseases, start, end, load_from_file=False, processes=1):
     if load_from_file:
         print("Loading learn and test data from npy files...")
         ypred_chads_vasc, y_chads_vasc, chads_vasc_scores = import_chads_vasc_data()
         x_learn, y_learn, x_test, y_test, labels, learn_groups, test_scores = import_predictor_data()
     else:
-        seed = random.randint(0, 1000000)
-        print("Used seed: {}".format(seed))
-        random.seed(seed)
-        ypred_chads_vasc, y_chads_vasc, chads_vasc_scores = simulate_chads_vasc(patients, start, end, only_test_set=True)
-        export_chads_vasc_data(ypred_chads_vasc, y_chads_vasc, chads_vasc_scores)
-
-        random.seed(seed)
-        x_learn, y_learn, x_test, y_test, labels, learn_groups, test_scores = simulate_predictor(
-            patients, diseases, start, end, day_since=True
-        )
-        export_predictor_data(x_learn, y_learn, x_test, y_test, labels, learn_groups, test_scores)
+        split = PatientSplit.from_patients(patients)
+        print("Used seed: {}".format(split.seed))
+        split.save("output/learning/split.npz")
+
+        print("Simulating CHADS-Vasc and Predictor...\nStart Date: {}\nEnd Date: {}".format(start, end))
+        start_timer = timeit.default_timer()
+        simulation = run_simulation(patients, diseases, start, end, processes=processes, split=split, day_since=True,
+                                    directory=EXPORT_DIRECTORY)
+        print("Time elapsed: {}".format(timeit.default_timer() - start_timer))
+
+        export_simulation(simulation)
+        del simulation
+        for name in ["x", "y", "scores"]:
+            os.remove(os.path.join(EXPORT_DIRECTORY, "simulation_{}.npy".format(name)))
+
+        ypred_chads_vasc, y_chads_vasc, chads_vasc_scores = import_chads_vasc_data()
+        x_learn, y_learn, x_test, y_test, labels, learn_groups, test_scores = import_predictor_data()
 
     cm_chads_vasc = ConfusionMatrix(y_chads_vasc, ypred_chads_vasc, name="CHA$_2$DS$_2$-VASc")
 
@@ -262,7 +605,7 @@ def compare_predictor_chads_vasc(patients, diseases, start, end, load_from_file=
     def cm_three_pair(n):
         return cm.tab20c(n + n // 3)
 
-    score_groups = [[0, 1], [2, 3]]
+    score_groups = [[0, 1], [2, 3], list(range(4, 10))]
     data = [
         [y_test, predictions_unknown, test_scores],
         [y_test, predictions_fixed, test_scores],
@@ -0,0 +1,43 @@
+from datetime import date as d, timedelta
+from unittest import TestCase, main
+
+from anticoagulant_decision import *
+from cohort import Cohort
+from test_cohort import sample_patients
+
+
+class TestDecisionRules(TestCase):
+    patients = sample_patients()
+    cohort = Cohort(patients)
+    dates = [d(1960, 1, 1) + timedelta(days=61 * i) for i in range(330)]
+
+    def test_has_bled(self):
+        scores = self.cohort.has_bled(self.dates)
+        for i, p in enumerate(self.patients.values()):
+            self.assertEqual(scores[i].tolist(), [has_bled(p, t) for t in self.dates])
+        self.assertEqual(scores.max(), 4)
+
+    def test_rules(self):
+        rules = [ChadsVascThreshold(1), ChadsVascThreshold(3), SexSpecificChadsVasc(1, 2), HasBledRule(1, 2),
+                 HasBledRule(2, 3)]
+        for rule in rules:
+            decided = rule.decide_cohort(self.cohort, self.dates)
+            for i, p in enumerate(self.patients.values()):
+                self.assertEqual(decided[i].tolist(), [rule.decide(p, t) for t in self.dates])
+                self.assertEqual(decided[i].tolist(), [p.should_have_AC(t, rule) for t in self.dates])
+
+    def test_registry(self):
+        self.assertRaises(TypeError, DecisionRule, "Undecided")
+        self.assertRaises(ValueError, register_rule, ChadsVascThreshold(2))
+        self.assertEqual(decision_rules["CHA2DS2-VASc >= 2"].threshold, 2)
+
+        decisions = evaluate_rules(self.cohort, self.dates)
+        self.assertEqual(sorted(decisions), sorted(decision_rules))
+        self.assertEqual(decisions["CHA2DS2-VASc >= 2"].tolist(),
+                         [[chads_vasc(p, t, max_value=2) for t in self.dates] for p in self.patients.values()])
+        self.assertEqual(list(evaluate_rules(self.cohort, d(2000, 1, 1), names=["CHA2DS2-VASc >= 2"])),
+                         ["CHA2DS2-VASc >= 2"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+from datetime import date as d, timedelta
+from unittest import TestCase, main
+
+from dateutil.relativedelta import relativedelta
+
+import numpy as np
+
+from anticoagulant_decision import future_stroke
+from cohort import NEVER, Cohort, add_months
+from diagnosis import Diagnosis
+from disease import Disease
+from disease_groups import *
+from medication import Medication
+from patient import Patient
+
+
+def sample_patients():
+    """ Four patients with CHA2DS2-VASc diagnoses, atrial fibrillation, strokes and medications """
+    patients = {1: Patient(1, 'm', d(1930, 1, 1), d(2015, 12, 31)),
+                2: Patient(2, 'v', d(1932, 2, 29), d(2008, 6, 1)),
+                3: Patient(3, 'v', d(1950, 7, 15), d(2017, 1, 1)),
+                4: Patient(4, 'm', d(1945, 12, 31), None)}
+
+    patients[1].add_diagnosis(Diagnosis(chads_vasc_c[0], d(1962, 1, 1), d(1963, 12, 31)))
+    patients[1].add_diagnosis(Diagnosis(chads_vasc_s[0], d(1963, 1, 1), d(1963, 12, 31)))
+    patients[2].add_diagnosis(Diagnosis(chads_vasc_h[1], d(1990, 5, 1), d(1990, 12, 31)))
+    patients[2].add_diagnosis(Diagnosis(chads_vasc_h[0], d(1985, 1, 1), d(1985, 12, 31)))
+    patients[3].add_diagnosis(Diagnosis(Disease("TEST", "1"), d(2000, 1, 1), d(2000, 12, 31)))
+    patients[3].add_diagnosis(Diagnosis(chads_vasc_v[0], d(2001, 1, 1), d(2001, 12, 31)))
+    patients[4].add_diagnosis(Diagnosis(chads_vasc_d[0], d(2009, 1, 1), d(2009, 12, 31)))
+
+    patients[1].add_diagnosis(Diagnosis(atrial_fib[0], d(1990, 3, 1), d(1990, 3, 1)))
+    patients[3].add_diagnosis(Diagnosis(atrial_fib[1], d(2003, 5, 1), d(2003, 5, 31)))
+    patients[3].add_diagnosis(Diagnosis(Disease("TEST", "1"), d(2010, 1, 1), d(2010, 1, 1)))
+
+    patients[1].add_medication(Medication("B01AA07", d(1990, 4, 1), d(1990, 12, 31)))
+    patients[1].add_medication(Medication("C07AB02", d(1989, 1, 1), d(1992, 1, 1)))
+    patients[3].add_medication(Medication("B01AC06", d(2003, 6, 1), d(2004, 2, 1)))
+    patients[3].add_medication(Medication("B01AA04", d(2003, 12, 1), d(2004, 6, 1)))
+    patients[3].add_medication(Medication("B01AA07", d(2009, 1, 1), d(2008, 1, 1)))
+    patients[2].add_medication(Medication("M01AE01", d(1998, 1, 1), d(1998, 6, 1)))
+    patients[4].add_medication(Medication("M01AB05", d(2013, 1, 1), d(2013, 6, 1)))
+
+    patients[2].add_diagnosis(Diagnosis(chads_vasc_s[1], d(1995, 7, 31), d(1995, 7, 31)))
+    patients[2].add_diagnosis(Diagnosis(chads_vasc_s[0], d(1995, 7, 31), d(1995, 8, 31)))
+    patients[2].add_diagnosis(Diagnosis(chads_vasc_s[0], d(1997, 2, 28), d(1997, 3, 31)))
+    for p in patients.values():
+        p.find_strokes()
+
+    return patients
+
+
+class TestCohort(TestCase):
+    patients = sample_patients()
+    cohort = Cohort(patients)
+    dates = [d(1960, 1, 1) + timedelta(days=97 * i) for i in range(220)] + [d(1997, 2, 28), d(1997, 3, 1)]
+
+    def test_single_date(self):
+        timestamp = d(2005, 6, 1)
+        scores = self.cohort.chads_vasc(timestamp)
+
+        self.assertEqual(scores.score.tolist(), [p.calculate_chads_vasc(timestamp) for p in self.patients.values()])
+        self.assertEqual(scores.age.tolist(), [p.calculate_age(timestamp) for p in self.patients.values()])
+        self.assertEqual(scores.alive.tolist(), [True, True, True, True])
+        self.assertEqual(scores.female.tolist(), [False, True, True, False])
+
+    def test_date_matrix(self):
+        scores = self.cohort.chads_vasc(self.dates)
+        self.assertEqual(scores.score.shape, (len(self.patients), len(self.dates)))
+
+        for i, p in enumerate(self.patients.values()):
+            self.assertEqual(scores.score[i].tolist(), [p.calculate_chads_vasc(t) for t in self.dates])
+            self.assertEqual(scores.age[i].tolist(), [p.calculate_age(t) for t in self.dates])
+            if p.death_date is not None:
+                self.assertEqual(scores.alive[i].tolist(), [p.is_alive(t) for t in self.dates])
+
+        self.assertTrue(np.array_equal(scores.score, self.cohort.chads_vasc(np.array(self.dates)).score))
+
+    def test_on_medication(self):
+        on_medication = self.cohort.on_medication("B01", self.dates)
+        for i, p in enumerate(self.patients.values()):
+            self.assertEqual(on_medication[i].tolist(), [p.has_medication_group("B01", t) for t in self.dates])
+
+        self.assertEqual(self.cohort.on_medication("B01", d(2004, 1, 1)).tolist(), [False, False, True, False])
+        self.assertEqual(self.cohort.on_medication("B01", self.dates[::-1]).tolist(), on_medication[:, ::-1].tolist())
+
+    def test_eligible(self):
+        for include_meds in [False, True]:
+            eligible = self.cohort.eligible(self.dates, include_meds=include_meds)
+            for i, p in enumerate(self.patients.values()):
+                expected = [p.is_alive(t) and p.has_disease_group(atrial_fib, t, chronic=True) and
+                            p.days_since_last_diagnosis(t) <= 365 and
+                            (include_meds or not p.has_medication_group("B01", t))
+                            if p.death_date is not None else False for t in self.dates]
+                self.assertEqual(eligible[i].tolist(), expected)
+
+    def test_add_months(self):
+        dates = self.dates + [d(2015, 1, 31), d(2016, 2, 29), d(2016, 8, 31)]
+        for months in [1, 6, 12, 24, -1]:
+            self.assertEqual(add_months(np.array(dates, dtype='datetime64[D]'), months).tolist(),
+                             [t + relativedelta(months=months) for t in dates])
+
+    def test_future_strokes(self):
+        strokes = self.cohort.future_strokes(self.dates)
+        self.assertEqual(sorted(strokes), [6, 12, 24])
+        for months, labels in strokes.items():
+            for i, p in enumerate(self.patients.values()):
+                self.assertEqual(labels[i].tolist(), [future_stroke(p, t, months=months) for t in self.dates])
+
+        self.assertTrue(strokes[12].any())
+        self.assertEqual(self.cohort.future_stroke(d(1995, 1, 31), months=6).tolist(), [False, True, False, False])
+        self.assertEqual(self.cohort.next_stroke(d(1995, 7, 31)).tolist(), [NEVER, d(1997, 2, 28), NEVER, NEVER])
+
+
+if __name__ == "__main__":
+    main()
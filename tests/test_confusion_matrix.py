@@ -1,6 +1,8 @@
 from unittest import TestCase, main
 
-from learning.confusion_matrix import ConfusionMatrix
+import numpy as np
+
+from learning.confusion_matrix import ConfusionMatrix, sweep_counts
 
 
 class TestConfusionMatrix(TestCase):
@@ -47,6 +49,37 @@ class TestConfusionMatrix(TestCase):
                 total += 1
         self.assertEqual(self.cf.prevalence, total/self.cf.population)
 
+    def test_arrays(self):
+        cf = ConfusionMatrix(np.array(self.true, dtype=bool), np.array(self.pred))
+        self.assertEqual(cf.matrix, self.cf.matrix)
+        self.assertEqual((cf.c_p, cf.c_n, cf.p_p, cf.p_n), (7, 3, 5, 5))
+
+
+class TestConfusionMatrixSweep(TestCase):
+    rng = np.random.RandomState(2)
+    true = rng.rand(500) < 0.3
+    scores = np.round(rng.rand(500) * 0.5 + true * 0.3, 2)
+    thresholds = [-1, 0, 0.1, 0.25, 0.3, 0.31, 0.5, 0.75, 2]
+
+    def test_sweep(self):
+        matrices = ConfusionMatrix.sweep(self.true, self.scores, self.thresholds, name="sweep")
+        self.assertEqual(len(matrices), len(self.thresholds))
+
+        for threshold, cf in zip(self.thresholds, matrices):
+            expected = ConfusionMatrix(self.true, (self.scores > threshold).astype(int))
+            self.assertEqual(cf.matrix, expected.matrix)
+            self.assertEqual((cf.c_p, cf.c_n, cf.p_p, cf.p_n),
+                             (expected.c_p, expected.c_n, expected.p_p, expected.p_n))
+            self.assertEqual(cf.s_beta(2), expected.s_beta(2))
+            self.assertEqual(cf.name, "sweep")
+            self.assertIsNone(cf.true)
+
+    def test_sweep_counts(self):
+        t_p, f_n, f_p, t_n = sweep_counts(self.true, self.scores, self.thresholds)
+        self.assertEqual((t_p + f_n + f_p + t_n).tolist(), [len(self.true)] * len(self.thresholds))
+        self.assertEqual(t_p[0], self.true.sum())
+        self.assertEqual(t_n[-1], (~self.true).sum())
+
 
 if __name__ == "__main__":
     main()
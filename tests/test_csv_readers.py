@@ -1,10 +1,16 @@
 import datetime
+import random
 from datetime import date as d
 from unittest import TestCase, main
 
-from csv_reader.diagnose_csv import get_diagnoses
-from csv_reader.medication_csv import get_medications
+import numpy as np
+
+from csv_reader.diagnose_csv import get_diagnoses, iter_diagnoses, dbc_end_date, dbc_end_dates, \
+    merge_overlapping_diagnoses, group_diagnoses, remove_overlap
+from csv_reader.medication_csv import get_medications, iter_medications, coalesce_medications
+from csv_reader.mergers import merge_data
 from csv_reader.patients_csv import get_patients
+from csv_reader.reader import convert_to_date, convert_column_to_date, to_dates
 from medication import Medication
 from patient import Patient
 from diagnosis import Diagnosis
@@ -53,6 +59,129 @@ class TestCsvReaders(TestCase):
                                                   Medication("B00BB02", d(2010, 6, 16), d(2010, 7, 16)),
                                                   Medication("0000000", d(2010, 12, 31), d(datetime.MAXYEAR, 12, 31))]})
 
+    def test_shared_instances(self):
+        self.assertIs(self.diagnoses[5][0].disease, self.diagnoses[123][0].disease)
+        self.assertIs(self.diagnoses[5][2].practitioner, self.diagnoses[123][1].practitioner)
+
+    def test_chunked(self):
+        for chunksize in [1, 2, 3, 100]:
+            self.assertEqual(get_diagnoses("test_data/test_diagnoses.csv", sep='\t', chunksize=chunksize),
+                             self.diagnoses)
+            self.assertEqual(get_medications("test_data/test_meds.csv", sep='\t', chunksize=chunksize),
+                             self.medications)
+
+    def test_iter_records(self):
+        # A run of rows is yielded as a whole, even when it spans multiple chunks
+        self.assertEqual([(patient_nr, len(records)) for patient_nr, records in
+                          iter_diagnoses("test_data/test_diagnoses.csv", sep='\t', chunksize=2)],
+                         [(5, 1), (123, 1), (5, 6), (123, 1), (5, 1), (123, 1)])
+        self.assertEqual([patient_nr for patient_nr, _ in
+                          iter_medications("test_data/test_meds.csv", sep='\t', chunksize=4)],
+                         [5, 123, 5, 123, 5, 123])
+
+
+class TestDateColumns(TestCase):
+    column = ["2010-01-01 00:00:00.000", "NULL", float('nan'), "2014-12-31 23:59:59.999",
+              "2015-01-01 00:00:00.000", "1999-02-28 12:00:00.000", d(2012, 2, 29)]
+
+    def test_convert_column_to_date(self):
+        self.assertEqual(to_dates(convert_column_to_date(self.column)).tolist(),
+                         [convert_to_date(v) for v in self.column])
+
+    def test_dbc_end_dates(self):
+        start_dates = [d(2014, 12, 31), d(2015, 1, 1), d(2012, 2, 29), d(2016, 9, 3)]
+        self.assertEqual(to_dates(dbc_end_dates(np.array(start_dates, dtype='datetime64[D]'))).tolist(),
+                         [dbc_end_date(v) for v in start_dates])
+
+    def test_dbc_end_dates_max_date(self):
+        self.assertEqual(to_dates(dbc_end_dates(np.array([d(datetime.MAXYEAR, 12, 31)], dtype='datetime64[D]'))).tolist(),
+                         [d(datetime.MAXYEAR, 12, 31)])
+
+
+class TestMergeOverlappingDiagnoses(TestCase):
+    @staticmethod
+    def merge_per_patient(diagnoses):
+        merged = {}
+        for patient_nr, patient_diagnoses in diagnoses.items():
+            merged[patient_nr] = []
+            for diagnosis_group in group_diagnoses(patient_diagnoses):
+                merged[patient_nr] += remove_overlap(diagnosis_group)
+        return merged
+
+    def test_same_as_per_patient(self):
+        rng = random.Random(3)
+        diseases = [Disease("TE{}".format(i), "00{}".format(j)) for i in range(3) for j in range(2)]
+        for _ in range(20):
+            diagnoses = {}
+            for patient_nr in rng.sample(range(100), 10):
+                diagnoses[patient_nr] = []
+                for _ in range(rng.randint(0, 15)):
+                    start = d(2010, 1, 1) + datetime.timedelta(days=rng.randint(0, 720))
+                    # Some end dates lie before the start date, as in the raw extracts
+                    end = start + datetime.timedelta(days=rng.randint(-30, 120))
+                    diagnoses[patient_nr].append(Diagnosis(rng.choice(diseases), start, end,
+                                                           practitioner=rng.choice(["John Deer", "Jane Doe", None])))
+
+            expected = self.merge_per_patient(diagnoses)
+            merge_overlapping_diagnoses(diagnoses)
+            self.assertEqual(diagnoses, expected)
+
+    def test_empty(self):
+        diagnoses = {1: []}
+        merge_overlapping_diagnoses(diagnoses)
+        self.assertEqual(diagnoses, {1: []})
+
+
+class TestCoalesceMedications(TestCase):
+    def test_coalesce(self):
+        medications = {5: [Medication("A00AA00", d(2010, 1, 1), d(2010, 3, 1)),
+                           Medication("B00BB01", d(2010, 6, 1), d(2010, 6, 7)),
+                           Medication("A00AA00", d(2010, 2, 1), d(2010, 2, 10)),
+                           Medication("A00AA00", d(2010, 3, 2), d(2010, 4, 1)),
+                           Medication("A00AA00", d(2010, 4, 3), d(datetime.MAXYEAR, 12, 31)),
+                           Medication("A00AA00", d(2011, 1, 1), d(2011, 2, 1))],
+                       123: [Medication("A00AA00", d(2010, 1, 1), d(2011, 1, 1)),
+                             Medication("A00AA00", d(2010, 1, 1), d(2011, 1, 1))],
+                       7: []}
+
+        self.assertEqual(coalesce_medications(medications), 4)
+        self.assertEqual(medications, {5: [Medication("A00AA00", d(2010, 1, 1), d(2010, 4, 1)),
+                                           Medication("A00AA00", d(2010, 4, 3), d(datetime.MAXYEAR, 12, 31)),
+                                           Medication("B00BB01", d(2010, 6, 1), d(2010, 6, 7))],
+                                       123: [Medication("A00AA00", d(2010, 1, 1), d(2011, 1, 1))],
+                                       7: []})
+
+    def test_nothing_to_coalesce(self):
+        medications = get_medications("test_data/test_meds.csv", sep='\t')
+        self.assertEqual(coalesce_medications(medications), 0)
+        self.assertEqual(sum(len(v) for v in medications.values()), 9)
+
+
+class TestMergeData(TestCase):
+    a = {1: "a", 2: "b"}
+    b = {3: "c"}
+    c = {4: "d", 5: "e"}
+
+    def test_merge(self):
+        merged = merge_data(merge_data(self.a, self.b), self.c)
+        self.assertEqual(dict(merged), {1: "a", 2: "b", 3: "c", 4: "d", 5: "e"})
+        self.assertEqual(list(merged.keys()), [1, 2, 3, 4, 5])
+        self.assertEqual(len(merged), 5)
+        self.assertEqual(merged[3], "c")
+        self.assertIn(5, merged)
+        self.assertNotIn(6, merged)
+        self.assertEqual(len(merged.maps), 3)
+
+    def test_no_copy(self):
+        value = ["shared"]
+        merged = merge_data({1: value}, self.b)
+        self.assertIs(merged[1], value)
+        self.assertEqual(self.a, {1: "a", 2: "b"})
+
+    def test_collision(self):
+        self.assertRaises(NotImplementedError, merge_data, self.a, {2: "x"})
+        self.assertRaises(NotImplementedError, merge_data, merge_data(self.a, self.b), {3: "x"})
+
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,10 @@
+import os
+import pickle
+import subprocess
+import sys
 from unittest import TestCase, main
 
-from disease import Disease
+from disease import Disease, DiseaseRegistry
 
 
 class TestDisease(TestCase):
@@ -27,6 +31,47 @@ class TestDisease(TestCase):
         self.assertNotEqual(hash(self.no_description), hash(self.other_diag))
         self.assertNotEqual(hash(self.no_description), hash(self.other_both))
 
+    def test_pickle(self):
+        # Pickled by an interpreter with a different string hash seed
+        code = "import pickle, sys; from disease import Disease; " \
+               "sys.stdout.buffer.write(pickle.dumps(Disease('TEST1', '000', description='Test 1')))"
+        env = dict(os.environ, PYTHONHASHSEED="1", PYTHONPATH=os.pathsep.join(sys.path))
+        disease = pickle.loads(subprocess.check_output([sys.executable, "-c", code], env=env))
+
+        self.assertEqual(hash(disease), hash(self.no_description))
+        self.assertEqual(str(disease), "Test 1")
+        self.assertEqual({self.no_description: 1}[disease], 1)
+
+
+class TestDiseaseRegistry(TestCase):
+    def test_get(self):
+        registry = DiseaseRegistry()
+        first = registry.get("TEST1", "000", description="Test 1")
+
+        self.assertIs(registry.get("TEST1", "000"), first)
+        self.assertIs(registry.get("TEST1", "000", description="Other"), first)
+        self.assertEqual(str(registry.get("TEST1", "000", description="Other")), "Test 1")
+        self.assertIsNot(registry.get("TEST1", "001"), first)
+        self.assertEqual(registry.get("TEST1", "000"), Disease("TEST1", "000"))
+        self.assertEqual(len(registry), 2)
+
+    def test_ids(self):
+        registry = DiseaseRegistry()
+        diseases = [registry.get("TEST1", str(i)) for i in range(5)]
+
+        self.assertEqual([registry.get_id(d) for d in diseases], list(range(5)))
+        self.assertEqual(registry.get_id(Disease("TEST1", "3")), 3)
+        self.assertEqual(registry.diseases, diseases)
+        self.assertRaises(KeyError, registry.get_id, Disease("TEST2", "0"))
+
+    def test_practitioners(self):
+        registry = DiseaseRegistry()
+        name = registry.get_practitioner("".join(["John ", "Deer"]))
+
+        self.assertIs(registry.get_practitioner("".join(["John ", "Deer"])), name)
+        self.assertEqual(registry.get_practitioner_id("John Deer"), 0)
+        self.assertEqual(registry.get_practitioner_id(registry.get_practitioner("Jane Doe")), 1)
+
 
 if __name__ == "__main__":
     main()
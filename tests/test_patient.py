@@ -1,6 +1,9 @@
-from datetime import date as d
+import random
+from datetime import date as d, timedelta
 from unittest import TestCase, main
 
+from dateutil.relativedelta import relativedelta
+
 from anticoagulant_decision import chads_vasc, future_stroke
 from diagnosis import Diagnosis
 from disease_groups import *
@@ -85,6 +88,47 @@ class TestPatientDiseases(TestCase):
         self.assertEqual(self.patient.days_since_last_diagnosis(d(2007, 2, 1)), 396)
 
 
+class TestDiagnosesIntervals(TestCase):
+    @staticmethod
+    def has_disease(diagnoses, timestamp, chronic):
+        return any((chronic and x.start_date <= timestamp) or x.start_date <= timestamp <= x.end_date
+                   for x in diagnoses)
+
+    @staticmethod
+    def days_since_diagnosis(diagnoses, timestamp):
+        days = [(timestamp - x.start_date).days for x in diagnoses if (timestamp - x.start_date).days >= 0]
+        return min(days) if days else 0
+
+    def test_same_as_scan(self):
+        rng = random.Random(7)
+        disease = Disease("TEST", "1")
+        patient = Patient(1, 'm', d(1950, 1, 1), d(2020, 1, 1))
+        diagnoses = []
+
+        for _ in range(30):
+            start = d(2005, 1, 1) + timedelta(days=rng.randint(0, 1000))
+            diagnosis = Diagnosis(disease, start, start + timedelta(days=rng.randint(0, 90)))
+            diagnoses.append(diagnosis)
+            patient.add_diagnosis(diagnosis)
+
+            for _ in range(20):
+                timestamp = d(2004, 12, 1) + timedelta(days=rng.randint(0, 1200))
+                for chronic in [False, True]:
+                    self.assertEqual(patient.has_disease(disease, timestamp, chronic=chronic),
+                                     self.has_disease(diagnoses, timestamp, chronic))
+                self.assertEqual(patient.days_since_diagnosis(disease, timestamp),
+                                 self.days_since_diagnosis(diagnoses, timestamp))
+
+    def test_overlapping(self):
+        patient = Patient(1, 'm', d(1950, 1, 1), d(2020, 1, 1))
+        patient.add_diagnosis(Diagnosis(Disease("TEST", "1"), d(2005, 1, 1), d(2006, 12, 31)))
+        patient.add_diagnosis(Diagnosis(Disease("TEST", "1"), d(2005, 6, 1), d(2005, 7, 1)))
+
+        self.assertTrue(patient.has_disease(Disease("TEST", "1"), d(2006, 1, 1)))
+        self.assertFalse(patient.has_disease(Disease("TEST", "1"), d(2007, 1, 1)))
+        self.assertEqual(patient.days_since_diagnosis(Disease("TEST", "1"), d(2006, 1, 1)), 214)
+
+
 class TestChadsVasc(TestCase):
     patient_male = Patient(1, 'm', d(1930, 1, 1), d(2015, 12, 31))
     patient_female = Patient(1, 'v', d(1930, 1, 1), d(2015, 12, 31))
@@ -109,6 +153,7 @@ class TestChadsVasc(TestCase):
 
     patient_male.find_strokes()
     patient_female.find_strokes()
+    patient_male.find_chads_vasc_changes()
 
     def test_find_strokes(self):
         expected_strokes = [d(1963, 1, 1), d(1969, 1, 1)]
@@ -116,6 +161,67 @@ class TestChadsVasc(TestCase):
         self.assertEqual(self.patient_male.strokes, expected_strokes)
         self.assertEqual(self.patient_female.strokes, expected_strokes)
 
+    def test_find_strokes_sorted_unique(self):
+        patient = Patient(1, 'm', d(1930, 1, 1), d(2015, 12, 31))
+        for start in [d(1969, 1, 1), d(1963, 1, 1), d(1969, 1, 1)]:
+            patient.add_diagnosis(Diagnosis(chads_vasc_s[-1], start, start))
+        patient.add_diagnosis(Diagnosis(chads_vasc_s[0], d(1963, 1, 1), d(1963, 1, 2)))
+        patient.find_strokes()
+
+        self.assertEqual(patient.strokes, [d(1963, 1, 1), d(1969, 1, 1)])
+        self.assertEqual(patient.next_stroke(d(1963, 1, 1)), d(1969, 1, 1))
+        self.assertIsNone(patient.next_stroke(d(1969, 1, 1)))
+
+    def test_future_stroke(self):
+        for timestamp in [d(1962, 1, 1) + timedelta(days=31 * i) for i in range(100)]:
+            for months in [6, 12, 24]:
+                expected = any(timestamp < s <= timestamp + relativedelta(months=+months)
+                               for s in self.patient_male.strokes)
+                self.assertEqual(future_stroke(self.patient_male, timestamp, months=months), expected)
+
+    @staticmethod
+    def scan_chads_vasc(patient, timestamp):
+        score = sum(points for group, points in chads_vasc_groups
+                    if patient.has_disease_group(group, timestamp, chronic=True))
+        age = patient.calculate_age(timestamp)
+        score += 2 if age >= 75 else 1 if age >= 65 else 0
+        return score + (1 if patient.is_female() else 0)
+
+    def test_calculate_chads_vasc(self):
+        self.assertEqual(self.patient_male.calculate_chads_vasc(d(1961, 12, 31)), 0)
+        self.assertEqual(self.patient_male.calculate_chads_vasc(d(1962, 1, 1)), 1)
+        self.assertEqual(self.patient_male.calculate_chads_vasc(d(1965, 1, 1)), 4)
+        self.assertEqual(self.patient_male.calculate_chads_vasc(d(1995, 1, 1)), 6)
+        self.assertEqual(self.patient_male.calculate_chads_vasc(d(2005, 1, 1)), 7)
+        self.assertEqual(self.patient_female.calculate_chads_vasc(d(2005, 1, 1)), 8)
+
+    def test_chads_vasc_changes(self):
+        dates, scores, base_score = self.patient_male.chads_vasc_changes
+        self.assertEqual(dates, [d(1962, 1, 1), d(1963, 1, 1), d(1965, 1, 1), d(1968, 1, 1), d(1995, 1, 1),
+                                 d(2005, 1, 1)])
+        self.assertEqual(scores, [1, 3, 4, 5, 6, 7])
+        self.assertEqual(base_score, 0)
+
+    def test_same_as_scan(self):
+        patient = Patient(2, 'v', d(1932, 2, 29), d(2015, 12, 31))
+        for diagnosis in self.diagnoses:
+            patient.add_diagnosis(diagnosis)
+
+        timestamp = d(1959, 12, 1)
+        while timestamp < d(2010, 1, 1):
+            self.assertEqual(patient.calculate_chads_vasc(timestamp), self.scan_chads_vasc(patient, timestamp))
+            timestamp += timedelta(days=13)
+
+        for timestamp in [d(1997, 2, 28), d(1997, 3, 1), d(2007, 2, 28), d(2007, 3, 1), d(2008, 2, 28), d(2008, 2, 29)]:
+            self.assertEqual(patient.calculate_chads_vasc(timestamp), self.scan_chads_vasc(patient, timestamp))
+
+    def test_add_diagnosis_resets_changes(self):
+        patient = Patient(3, 'm', d(1930, 1, 1), d(2015, 12, 31))
+        self.assertEqual(patient.calculate_chads_vasc(d(1970, 1, 1)), 0)
+
+        patient.add_diagnosis(Diagnosis(chads_vasc_d[0], d(1960, 1, 1), d(1960, 12, 31)))
+        self.assertEqual(patient.calculate_chads_vasc(d(1970, 1, 1)), 1)
+
 
 class TestPatientMedication(TestCase):
     patient = Patient(1, 'm', d(1970, 6, 6), d(2016, 10, 5))
@@ -147,6 +253,53 @@ class TestPatientMedication(TestCase):
         self.assertEqual("B00BB01", self.patient.has_medication_group("B0", d(2010, 8, 3), which=True))
 
 
+class TestMedicationsIndex(TestCase):
+    @staticmethod
+    def has_medication_group(medications, starts_with, timestamp, which):
+        last = None
+        last_date = d(1, 1, 1)
+        for code in dict.fromkeys(m.code for m in medications):
+            for m in medications:
+                if m.code == code and code.startswith(starts_with) and m.start_date <= timestamp <= m.end_date:
+                    if not which:
+                        return True
+                    elif m.start_date > last_date:
+                        last_date = m.start_date
+                        last = code
+        if which and last is not None:
+            return last
+        return False
+
+    def test_same_as_scan(self):
+        rng = random.Random(13)
+        codes = ["B01AA04", "B01AA07", "B01AC06", "B01AF01", "C03CA01", "C07AB02", "N02BE01"]
+        patient = Patient(1, 'm', d(1950, 1, 1), d(2020, 1, 1))
+        medications = []
+
+        for _ in range(40):
+            start = d(2010, 1, 1) + timedelta(days=rng.randint(0, 700))
+            medication = Medication(rng.choice(codes), start, start + timedelta(days=rng.randint(0, 120)))
+            medications.append(medication)
+            patient.add_medication(medication)
+
+            for _ in range(10):
+                timestamp = d(2009, 12, 1) + timedelta(days=rng.randint(0, 900))
+                for starts_with in ["B01", "B01A", "B01AA07", "C0", "N", "X", ""]:
+                    for which in [False, True]:
+                        self.assertEqual(patient.has_medication_group(starts_with, timestamp, which=which),
+                                         self.has_medication_group(medications, starts_with, timestamp, which))
+
+    def test_prefix(self):
+        patient = Patient(1, 'm', d(1950, 1, 1), d(2020, 1, 1))
+        for code in ["B01AC06", "B01AA07", "B02BX01", "B01"]:
+            patient.add_medication(Medication(code, d(2010, 1, 1), d(2010, 12, 31)))
+
+        self.assertEqual(patient.medications.codes_starting_with("B01"), ["B01", "B01AA07", "B01AC06"])
+        self.assertEqual(patient.medications.codes_starting_with("B01A"), ["B01AA07", "B01AC06"])
+        self.assertEqual(patient.medications.codes_starting_with("C"), [])
+        self.assertEqual(patient.has_medication_group("B01", d(2010, 6, 1), which=True), "B01AC06")
+
+
 class TestPatientShouldHaveAC(TestCase):
     patient = Patient(1, 'm', d(1937, 5, 14), d(2017, 12, 31))
 
@@ -0,0 +1,47 @@
+from unittest import TestCase, main
+
+import numpy as np
+from sklearn import ensemble
+from sklearn.base import clone
+from sklearn.model_selection import GroupKFold
+
+from learning.predictor import custom_score, cutoff_rates, out_of_fold_probabilities, s_beta_scores
+
+
+class TestCutoffSearch(TestCase):
+    rng = np.random.RandomState(4)
+    x = rng.randint(0, 100, size=(400, 5))
+    y = (x[:, 0] + rng.randint(0, 60, size=400)) > 120
+    groups = np.arange(400) // 4
+
+    def test_out_of_fold_probabilities(self):
+        clf = ensemble.RandomForestClassifier(n_estimators=10, random_state=1)
+        cv = GroupKFold(n_splits=5)
+        probabilities, folds = out_of_fold_probabilities(clf, self.x, self.y, self.groups, cv)
+
+        self.assertEqual(sorted(np.concatenate(folds).tolist()), list(range(400)))
+        for (learn, validate), fold in zip(cv.split(self.x, self.y, self.groups), folds):
+            self.assertEqual(validate.tolist(), fold.tolist())
+            fold_clf = clone(clf).fit(self.x[learn], self.y[learn])
+            self.assertTrue(np.array_equal(probabilities[validate], fold_clf.predict_proba(self.x[validate])[:, 1]))
+
+    def test_same_as_custom_score(self):
+        clf = ensemble.RandomForestClassifier(n_estimators=10, random_state=1)
+        cv = GroupKFold(n_splits=5)
+        probabilities, folds = out_of_fold_probabilities(clf, self.x, self.y, self.groups, cv)
+
+        cutoffs = np.arange(0.05, 1, 0.05)
+        tpr, tnr = cutoff_rates(self.y, probabilities, folds, cutoffs)
+        for beta in [1, 2]:
+            scores = s_beta_scores(tpr, tnr, beta)
+            self.assertEqual(scores.shape, (len(cutoffs), len(folds)))
+
+            for (learn, validate), j in zip(cv.split(self.x, self.y, self.groups), range(len(folds))):
+                fold_clf = clone(clf).fit(self.x[learn], self.y[learn])
+                for i, c in enumerate(cutoffs):
+                    expected = custom_score(c, beta)(fold_clf, self.x[validate], self.y[validate])
+                    self.assertAlmostEqual(scores[i, j], expected)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import os
+import random
+import tempfile
+from datetime import date as d, timedelta
+from unittest import TestCase, main
+
+import numpy as np
+
+from dateutil.relativedelta import relativedelta
+
+from diagnosis import Diagnosis
+from disease import Disease
+from disease_groups import *
+from medication import Medication
+from patient import Patient
+from anticoagulant_decision import chads_vasc, decision_rules, future_stroke
+from learning.confusion_matrix import ConfusionMatrix
+from simulations.simulations import *
+
+
+def random_patients(seed):
+    rng = random.Random(seed)
+    patients = {}
+    for number in range(1, 41):
+        birth = d(1920, 1, 1) + timedelta(days=rng.randint(0, 15000))
+        patient = Patient(number, rng.choice("mv"), birth, d(2008, 1, 1) + timedelta(days=rng.randint(0, 4000)))
+        for _ in range(rng.randint(1, 6)):
+            start = d(2004, 1, 1) + timedelta(days=rng.randint(0, 4000))
+            disease = rng.choice(atrial_fib + stroke_diseases[:1] + [Disease("TEST", "1")])
+            patient.add_diagnosis(Diagnosis(disease, start, start + timedelta(days=rng.randint(0, 60))))
+        for _ in range(rng.randint(0, 3)):
+            start = d(2004, 1, 1) + timedelta(days=rng.randint(0, 4000))
+            code = rng.choice(["B01AA07", "B01AC06", "C07AB02"])
+            patient.add_medication(Medication(code, start, start + timedelta(days=rng.randint(0, 300))))
+        patient.find_strokes()
+        patients[number] = patient
+
+    return patients
+
+
+class TestPatientMonthGenerator(TestCase):
+    patients = random_patients(3)
+
+    @staticmethod
+    def scan(patients, start, end, step, include_meds):
+        sim_date = start
+        while sim_date < end:
+            for patient_nr, patient in patients.items():
+                if patient.is_alive(sim_date) \
+                   and patient.has_disease_group(atrial_fib, sim_date, chronic=True) \
+                   and patient.days_since_last_diagnosis(sim_date) <= 365 \
+                   and (not patient.has_medication_group("B01", sim_date) or include_meds):
+                    yield patient, sim_date
+            sim_date += relativedelta(months=+step)
+
+    def test_simulation_dates(self):
+        self.assertEqual(simulation_dates(d(2010, 1, 31), d(2010, 5, 1)),
+                         [d(2010, 1, 31), d(2010, 2, 28), d(2010, 3, 28), d(2010, 4, 28)])
+        self.assertEqual(simulation_dates(d(2010, 1, 1), d(2010, 1, 1)), [])
+
+    def test_same_as_scan(self):
+        for step, include_meds in [(1, False), (1, True), (12, True)]:
+            generated = [(p, t) for p, t, _ in patient_month_generator(self.patients, d(2005, 1, 1), d(2017, 1, 1),
+                                                                       step=step, include_meds=include_meds)]
+            self.assertEqual(generated,
+                             list(self.scan(self.patients, d(2005, 1, 1), d(2017, 1, 1), step, include_meds)))
+
+    def test_split(self):
+        split = PatientSplit([1, 2, 3])
+        for patient, _, in_test_set in patient_month_generator(self.patients, d(2005, 1, 1), d(2017, 1, 1),
+                                                               split=split):
+            self.assertEqual(in_test_set, patient.number not in [1, 2, 3])
+
+
+class TestPatientSplit(TestCase):
+    patients = random_patients(5)
+
+    def test_seed(self):
+        split = PatientSplit.from_patients(self.patients, seed=42)
+        self.assertEqual(split.learn_set, PatientSplit.from_patients(self.patients, seed=42).learn_set)
+        self.assertEqual(split.learn_set, set(get_patient_subset(self.patients, seed=42)))
+        self.assertEqual(split.seed, 42)
+
+        positive = [n for n, p in self.patients.items()
+                    if p.has_disease_group(stroke_diseases, d(2050, 1, 1), chronic=True)]
+        self.assertEqual(len(split.learn_set), 2 * int(len(positive) * 0.5))
+        self.assertEqual(len(split.learn_set & set(positive)), int(len(positive) * 0.5))
+
+    def test_in_test_set(self):
+        split = PatientSplit([1, 4])
+        self.assertFalse(split.in_test_set(1))
+        self.assertTrue(split.in_test_set(2))
+
+    def test_save_load(self):
+        directory = tempfile.mkdtemp()
+        fname = os.path.join(directory, "split.npz")
+
+        split = PatientSplit.from_patients(self.patients, seed=7)
+        split.save(fname)
+        loaded = PatientSplit.load(fname)
+        self.assertEqual(loaded.learn_set, split.learn_set)
+        self.assertEqual(loaded.seed, 7)
+
+        split = PatientSplit([3, 1])
+        split.save(fname)
+        loaded = PatientSplit.load(fname)
+        self.assertEqual(loaded.learn_set, {1, 3})
+        self.assertIsNone(loaded.seed)
+
+        os.remove(fname)
+        os.rmdir(directory)
+
+
+class TestSimulate(TestCase):
+    patients = random_patients(11)
+    diseases = atrial_fib + stroke_diseases[:1] + [Disease("TEST", "1")]
+    split = PatientSplit.from_patients(patients, seed=3)
+
+    def scan(self, start, end):
+        for patient, sim_date, in_test_set in patient_month_generator(self.patients, start, end, split=self.split):
+            x, y = get_feature_slice(self.diseases, patient, sim_date)
+            yield (x, y, patient.calculate_chads_vasc(sim_date),
+                   patient.should_have_AC(sim_date, chads_vasc, max_value=2), patient.number, in_test_set)
+
+    def test_same_as_scan(self):
+        simulation = simulate(self.patients, self.diseases, d(2005, 1, 1), d(2017, 1, 1), split=self.split,
+                              rules=list(decision_rules))
+        expected = list(self.scan(d(2005, 1, 1), d(2017, 1, 1)))
+        self.assertTrue(any(row[1] for row in expected))
+
+        self.assertEqual(simulation.x.tolist(), [row[0] for row in expected])
+        self.assertEqual(simulation.y.tolist(), [row[1] for row in expected])
+        self.assertEqual(simulation.scores.tolist(), [row[2] for row in expected])
+        self.assertEqual(simulation.chads_vasc_pred.tolist(), [row[3] for row in expected])
+        self.assertEqual(simulation.groups.tolist(), [row[4] for row in expected])
+        self.assertEqual(simulation.in_test_set.tolist(), [row[5] for row in expected])
+        self.assertEqual(simulation.labels, get_feature_labels(self.diseases))
+
+        rule = decision_rules["CHA2DS2-VASc >= 2"]
+        self.assertEqual(simulation.decisions[rule.name].tolist(), simulation.chads_vasc_pred.tolist())
+        self.assertEqual(sorted(simulation.decisions), sorted(decision_rules))
+        self.assertEqual(simulate(self.patients, self.diseases, d(2005, 1, 1), d(2017, 1, 1), split=self.split,
+                                  features=False).decisions, {})
+        patient_dates = [(p, t) for p, t, _ in patient_month_generator(self.patients, d(2005, 1, 1), d(2017, 1, 1),
+                                                                       split=self.split)]
+        for name, decided in simulation.decisions.items():
+            self.assertEqual(decided.tolist(), [decision_rules[name].decide(p, t) for p, t in patient_dates])
+
+    def test_feature_matrix(self):
+        patient_dates = [(p, t) for p, t, _ in patient_month_generator(self.patients, d(2005, 1, 1), d(2017, 1, 1),
+                                                                       split=self.split)]
+        diseases = self.diseases[::-1] + [Disease("NOT", "1")]
+        for days_since in [True, False]:
+            expected = [get_feature_slice(diseases, p, t, days_since=days_since)[0] for p, t in patient_dates]
+            x = get_feature_matrix(diseases, patient_dates, days_since=days_since)
+            self.assertEqual(x.tolist(), expected)
+            self.assertEqual(x.shape[1], len(get_feature_labels(diseases)))
+
+        x = get_feature_matrix(diseases, patient_dates, days_since=False, sparse=True)
+        self.assertEqual(x.toarray().tolist(), get_feature_matrix(diseases, patient_dates, days_since=False).tolist())
+        x = get_feature_matrix(diseases, patient_dates, days_since=True, sparse=True)
+        self.assertEqual(decode_days_since(x).tolist(), get_feature_matrix(diseases, patient_dates).tolist())
+        self.assertLess(x.nnz, x.shape[0] * x.shape[1])
+
+        # Rows are carried forward per patient in date order, whatever order the rows are in
+        random.Random(2).shuffle(patient_dates)
+        expected = [get_feature_slice(diseases, p, t)[0] for p, t in patient_dates]
+        self.assertEqual(get_feature_matrix(diseases, patient_dates).tolist(), expected)
+        self.assertEqual(get_feature_matrix(diseases, []).shape, (0, len(diseases) + 2))
+
+        out = np.full((len(patient_dates), len(diseases) + 2), -1, dtype=np.int64)
+        self.assertIs(get_feature_matrix(diseases, patient_dates, out=out), out)
+        self.assertEqual(out.tolist(), expected)
+        self.assertRaises(ValueError, get_feature_matrix, diseases, patient_dates, sparse=True, out=out)
+
+    def test_parallel(self):
+        serial = simulate(self.patients, self.diseases, d(2005, 1, 1), d(2017, 1, 1), split=self.split,
+                          rules=list(decision_rules))
+        parallel = simulate_parallel(self.patients, self.diseases, d(2005, 1, 1), d(2017, 1, 1), split=self.split,
+                                     processes=2, shards_per_process=3, rules=list(decision_rules))
+        self.assertEqual(sorted(serial.decisions), sorted(decision_rules))
+        self.assertEqual(sorted(serial.decisions), sorted(parallel.decisions))
+        for name, decided in serial.decisions.items():
+            self.assertEqual(decided.tobytes(), parallel.decisions[name].tobytes())
+
+        for field in Simulation._fields:
+            a, b = getattr(serial, field), getattr(parallel, field)
+            if field == 'decisions':
+                continue
+            if isinstance(a, np.ndarray):
+                self.assertEqual(a.dtype, b.dtype)
+                self.assertEqual(a.tobytes(), b.tobytes())
+            else:
+                self.assertEqual(a, b)
+
+    def test_directory(self):
+        serial = simulate(self.patients, self.diseases, d(2005, 1, 1), d(2017, 1, 1), split=self.split)
+        for processes in [1, 2]:
+            directory = tempfile.mkdtemp()
+            simulation = run_simulation(self.patients, self.diseases, d(2005, 1, 1), d(2017, 1, 1),
+                                        processes=processes, split=self.split, directory=directory)
+            for field in ['x', 'y', 'scores']:
+                self.assertIsInstance(getattr(simulation, field), np.memmap)
+                self.assertEqual(getattr(simulation, field).tobytes(), getattr(serial, field).tobytes())
+                stored = load_array(os.path.join(directory, "simulation_{}.npy".format(field)))
+                self.assertEqual(stored.tolist(), getattr(serial, field).tolist())
+
+            del simulation, stored
+            for fname in os.listdir(directory):
+                os.remove(os.path.join(directory, fname))
+            os.rmdir(directory)
+
+        ypred, y, scores = simulate_chads_vasc(self.patients, d(2005, 1, 1), d(2017, 1, 1), split=self.split,
+                                               processes=2)
+        for a, b in zip((ypred, y, scores), chads_vasc_data(serial)):
+            self.assertEqual(a.tolist(), b.tolist())
+
+    def test_wrappers(self):
+        x_learn, y_learn, x_test, y_test, labels, learn_groups, test_scores = simulate_predictor(
+            self.patients, self.diseases, d(2005, 1, 1), d(2017, 1, 1), split=self.split)
+        expected = list(self.scan(d(2005, 1, 1), d(2017, 1, 1)))
+        self.assertEqual(x_test.tolist(), [row[0] for row in expected if row[5]])
+        self.assertEqual(y_learn.tolist(), [row[1] for row in expected if not row[5]])
+        self.assertEqual(learn_groups.tolist(), [row[4] for row in expected if not row[5]])
+        self.assertEqual(test_scores.tolist(), [row[2] for row in expected if row[5]])
+
+        ypred, y, scores = simulate_chads_vasc(self.patients, d(2005, 1, 1), d(2017, 1, 1), only_test_set=True,
+                                               split=self.split)
+        self.assertEqual(ypred.tolist(), [int(row[3]) for row in expected if row[5]])
+        self.assertEqual(y.tolist(), [int(row[1]) for row in expected if row[5]])
+        self.assertEqual(scores.tolist(), test_scores.tolist())
+
+    def test_export_import(self):
+        simulation = simulate(self.patients, self.diseases, d(2005, 1, 1), d(2017, 1, 1), split=self.split)
+        directory = tempfile.mkdtemp()
+
+        export_simulation(simulation, directory=directory)
+        imported = import_chads_vasc_data(directory=directory) + import_predictor_data(directory=directory)
+        self.assertIsInstance(imported[3], np.memmap)
+        for a, b in zip(imported, chads_vasc_data(simulation, only_test_set=True) + predictor_data(simulation)):
+            self.assertEqual(np.asarray(a).tolist(), np.asarray(b).tolist())
+            if isinstance(b, np.ndarray):
+                self.assertEqual(a.dtype, b.dtype)
+
+        # Exporting in small chunks or from the split arrays gives the same files
+        save_array(os.path.join(directory, "x.npy"), simulation.x, rows=simulation.in_test_set, chunk_size=7)
+        self.assertEqual(load_array(os.path.join(directory, "x.npy")).tolist(), imported[5].tolist())
+        export_predictor_data(*predictor_data(simulation), directory=directory)
+        self.assertEqual(import_predictor_data(directory=directory)[0].tolist(), imported[3].tolist())
+
+        del imported
+        for fname in os.listdir(directory):
+            os.remove(os.path.join(directory, fname))
+        os.rmdir(directory)
+
+
+class TestGroupedMatrices(TestCase):
+    rng = np.random.RandomState(6)
+    models, sexes = [], []
+    for _ in range(3):
+        models.append((rng.rand(300) < 0.2, rng.rand(300) < 0.4, rng.randint(0, 10, size=300)))
+        sexes.append(rng.choice(['m', 'v'], size=300))
+
+    def test_score_bands(self):
+        self.assertEqual(score_bands([0, 1, 2, 3, 4, 9], [[0, 1], [2, 3]]).tolist(), [0, 0, 1, 1, 2, 2])
+        self.assertEqual(score_bands([0, 1, 2, 3, 12], [[1], [3, 4]]).tolist(), [2, 0, 2, 1, 2])
+        self.assertEqual(score_band_labels([[0, 1], [2, 3]]), ["0 - 1", "2 - 3", "Other"])
+        self.assertEqual(score_band_labels([[1], [3, 4]]), ["1", "3 - 4", "Other"])
+
+    def test_same_as_loops(self):
+        score_groups = [[0, 1], [2, 3], [4]]
+        cms = get_grouped_matrices(self.models, score_groups, names=["a", "b", "c"])
+        self.assertEqual(len(cms), 4 * 3)
+
+        for i, l in enumerate(score_band_labels(score_groups)):
+            for j, (true, pred, scores) in enumerate(self.models):
+                band = score_bands(scores, score_groups) == i
+                expected = ConfusionMatrix(true[band].astype(int), pred[band].astype(int))
+                self.assertEqual(cms[i * 3 + j].matrix, expected.matrix)
+                self.assertEqual(cms[i * 3 + j].name, "{} {}".format(l, "abc"[j]))
+
+        # Without scores outside of the groups there are no other band matrices
+        cms = get_grouped_matrices(self.models, [[0, 1], list(range(2, 10))], names=["a", "b", "c"])
+        self.assertEqual([cm.name for cm in cms[::3]], ["0 - 1 a", "2 - 9 a"])
+
+    def test_strata(self):
+        score_groups = [[0, 1, 2], [3]]
+        counts, stratum_values = grouped_counts(self.models, score_groups, strata=self.sexes)
+        self.assertEqual(counts.shape, (3, 3, 2, 4))
+        self.assertEqual(stratum_values, ['m', 'v'])
+        self.assertEqual(counts.sum(), 900)
+
+        for j, ((true, pred, scores), sex) in enumerate(zip(self.models, self.sexes)):
+            bands = score_bands(scores, score_groups)
+            for i in range(3):
+                for k, stratum in enumerate(stratum_values):
+                    rows = (bands == i) & (sex == stratum)
+                    self.assertEqual(tuple(counts[j, i, k].tolist()), ConfusionMatrix(true[rows], pred[rows]).matrix)
+
+        cms = get_grouped_matrices(self.models, score_groups, names=["a", "b", "c"], strata=self.sexes)
+        self.assertEqual([cm.name for cm in cms[:4]], ["0 - 2 m a", "0 - 2 m b", "0 - 2 m c", "0 - 2 v a"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, main
+
+from csv_reader.sites import prepare_sites, combine_sites
+
+DATA_FILES = ("test_data/test_patients.csv", "test_data/test_diagnoses.csv", "test_data/test_meds.csv")
+
+
+def split_site(directory, patient_nr):
+    """ Writes the rows of a single patient in the test data to the same files in directory """
+    files = []
+    for source in DATA_FILES:
+        with open(source) as f:
+            header, *rows = f.readlines()
+        fname = os.path.join(directory, os.path.basename(source))
+        with open(fname, 'w') as f:
+            f.write(header)
+            f.writelines(row for row in rows if row.split('\t')[0] == str(patient_nr))
+        files.append(fname)
+
+    return files
+
+
+class TestSites(TestCase):
+    def setUp(self):
+        self.directories = [tempfile.mkdtemp() for _ in range(2)]
+        self.site_files = [split_site(directory, patient_nr)
+                           for directory, patient_nr in zip(self.directories, (5, 123))]
+
+    def tearDown(self):
+        for directory in self.directories:
+            shutil.rmtree(directory)
+
+    def test_prepare_sites(self):
+        sites = prepare_sites(self.site_files, processes=2)
+
+        self.assertEqual(list(sites[0]), [5])
+        self.assertEqual(list(sites[1]), [123])
+
+    def test_combine_sites(self):
+        patients, diagnoses, medications = combine_sites(prepare_sites(self.site_files, processes=2))
+
+        self.assertEqual(sorted(patients), [5, 123])
+        self.assertEqual(sorted(diagnoses), [5, 123])
+        self.assertEqual(sorted(medications), [5, 123])
+        self.assertEqual(patients[123].sex, 'v')
+        self.assertEqual(medications[5][0].code, "A00AA00")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+from unittest import TestCase, main
+
+import numpy as np
+
+from csv_reader.diagnose_csv import get_diagnoses
+from csv_reader.medication_csv import get_medications
+from csv_reader.patients_csv import get_patients
+from csv_reader.store import save_store, load_store
+
+
+class TestStore(TestCase):
+    patients = get_patients("test_data/test_patients.csv", sep='\t')
+    diagnoses = get_diagnoses("test_data/test_diagnoses.csv", sep='\t')
+    medications = get_medications("test_data/test_meds.csv", sep='\t')
+
+    for patient_nr, patient_diagnoses in diagnoses.items():
+        for diagnosis in patient_diagnoses:
+            patients[patient_nr].add_diagnosis(diagnosis)
+    for patient_nr, patient_medications in medications.items():
+        for medication in patient_medications:
+            patients[patient_nr].add_medication(medication)
+    for p in patients.values():
+        p.set_care_range(extra_months=12)
+        p.find_strokes()
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.fname = os.path.join(directory, "store.npz")
+        save_store(self.fname, self.patients, self.diagnoses, self.medications)
+        self.store = load_store(self.fname)
+
+    def tearDown(self):
+        os.remove(self.fname)
+        os.rmdir(os.path.dirname(self.fname))
+
+    def test_records(self):
+        self.assertEqual(dict(self.store.diagnoses), self.diagnoses)
+        self.assertEqual(dict(self.store.medications), self.medications)
+        self.assertEqual(list(self.store.diagnoses.keys()), list(self.diagnoses.keys()))
+
+    def test_patients(self):
+        self.assertEqual(list(self.store.keys()), list(self.patients.keys()))
+        for number, patient in self.patients.items():
+            stored = self.store[number]
+            self.assertEqual(stored, patient)
+            self.assertEqual(stored.diagnoses, patient.diagnoses)
+            self.assertEqual(stored.diagnoses.last_diagnosis, patient.diagnoses.last_diagnosis)
+            self.assertEqual(stored.medications, patient.medications)
+            self.assertEqual(stored.care_range, patient.care_range)
+            self.assertEqual(stored.strokes, patient.strokes)
+
+    def test_lazy_views(self):
+        self.assertIs(self.store[5], self.store[5])
+        last_diagnosis = self.store[5].diagnoses.last_diagnosis
+        self.assertTrue(any(d is last_diagnosis for d in self.store.diagnoses[5]))
+
+    def test_version(self):
+        with np.load(self.fname) as data:
+            arrays = {k: data[k] for k in data.files}
+        arrays['version'] = np.array(0)
+        np.savez(self.fname, **arrays)
+
+        self.assertRaises(ValueError, load_store, self.fname)
+
+
+if __name__ == "__main__":
+    main()